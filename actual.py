@@ -2,9 +2,12 @@ import json
 import os
 import sublime
 import sublime_plugin
+import tempfile
 
 from .view import ActualVim
 from .edit import Edit
+from .latency import tracer
+from . import neo
 from . import settings
 
 
@@ -59,7 +62,60 @@ class ActualKeypress(sublime_plugin.TextCommand):
             if key is not None:
                 if key == '<':
                     key = '<lt>'
+                if neo._loaded:
+                    mode = v.vim.status_last.get('mode')
+                    tracer.start(key, neo.MODES.get(mode, mode))
                 v.press(key, edit=edit)
+                tracer.finish()
+
+
+class ActualDumpLatency(sublime_plugin.ApplicationCommand):
+    def run(self, path=None, reset=False):
+        tracer.dump(path)
+        if path:
+            print('ActualVim: wrote keystroke latency to', path)
+        if reset:
+            tracer.reset()
+
+
+class ActualRpcProfile(sublime_plugin.ApplicationCommand):
+    def is_enabled(self):
+        return neo._loaded
+
+    def run(self, action='dump', path=None):
+        vim = neo.active_instance()
+        if action == 'start':
+            vim.rpc_profile()
+        elif action == 'stop':
+            vim.rpc_profile(False)
+        elif action == 'reset':
+            if vim.profiler:
+                vim.profiler.reset()
+        elif action == 'dump':
+            if not vim.profiler:
+                print('ActualVim: rpc profiler is not running')
+            elif path:
+                with open(path, 'w') as f:
+                    json.dump(vim.rpc_snapshot(), f, indent=2, sort_keys=True)
+                print('ActualVim: wrote rpc profile to', path)
+            else:
+                print(vim.profiler.report())
+
+
+class ActualRecordRedraw(sublime_plugin.ApplicationCommand):
+    def is_enabled(self):
+        return neo._loaded
+
+    def run(self, action='start', path=None):
+        vim = neo.active_instance()
+        if action == 'start':
+            path = path or os.path.join(tempfile.gettempdir(), 'actualvim-redraw.msgpack')
+            vim.record(path)
+            print('ActualVim: recording redraw events to', path)
+        elif vim.recorder:
+            rec = vim.recorder
+            vim.record(None)
+            print('ActualVim: recorded {} redraw batches to {}'.format(rec.batches, rec.path))
 
 
 class ActualViewListener(sublime_plugin.ViewEventListener):
@@ -82,15 +138,20 @@ class ActualViewListener(sublime_plugin.ViewEventListener):
     def on_activated(self):
         self.v.activate()
 
-    # def on_deactivated_async(self):
-    #    pass
+    def on_deactivated_async(self):
+        self.v.save_state()
 
     # if we don't do this async, bad selections never display, which reduces flickering
     def on_selection_modified(self):
-        self.v.sel_to_vim()
+        v = self.v
+        if v.dragging:
+            v.drag_update()
+        else:
+            v.sel_to_vim()
 
     def on_modified(self):
         self.v.sync_to_vim()
+        self.v.completer.modified()
 
 
 class ActualGlobalListener(sublime_plugin.EventListener):
@@ -109,6 +170,8 @@ class ActualGlobalListener(sublime_plugin.EventListener):
         if v:
             v.set_path(view.file_name())
             v.buf.options['modified'] = view.is_dirty()
+            v.save_state()
+            v.save_undo()
 
     # block sublime -> vim copies during text commands
     # to prevent inconsistent updates
@@ -120,6 +183,10 @@ class ActualGlobalListener(sublime_plugin.EventListener):
 
         if name == 'drag_select':
             v.drag_select = args.get('by')
+            v.dragging = True
+        elif v.dragging:
+            # missed the end of a drag, make sure vim has the final selection
+            v.drag_end()
 
         if not name.startswith('actual_'):
             v.block = True
@@ -132,12 +199,20 @@ class ActualGlobalListener(sublime_plugin.EventListener):
         if not v:
             return
 
+        # sublime runs drag_select until the mouse button is released
+        if name == 'drag_select' and v.dragging:
+            v.drag_end()
+
         if v.block:
             v.block = False
             if v.block_hit:
                 v.block_hit = False
                 def fix():
-                    v.sync_to_vim(force=True)
+                    # a view nvim isn't showing (output panel, background formatter) syncs when idle
+                    if v.vim.av is not v:
+                        v.defer_sync()
+                    else:
+                        v.sync_to_vim(force=True)
                 sublime.set_timeout(fix, 1)
 
     def on_post_window_command(self, view, name, args):
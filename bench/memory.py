@@ -0,0 +1,145 @@
+"""Compare what a painted Screen holds in memory, before and after interning.
+
+Paints every row with the redraw events nvim sends for syntax-highlighted
+text: a `highlight_set` before each run of cells, with a freshly decoded
+attribute dict every time, like msgpack hands them to Screen. The same batch
+is painted into the current Screen (interned highlight ids, `__slots__`
+cells) and into a copy of the previous one (a `__dict__` per cell holding
+whatever dict `highlight_set` delivered). Reports the bytes each screen still
+holds once the batch is gone, and how long `highlights()` takes on it.
+
+    python bench/memory.py [--width W] [--height H] [--run N] [--repeat N]
+"""
+import argparse
+import time
+
+import package
+from ActualVim.screen import Screen
+
+try:
+    import tracemalloc
+except ImportError:
+    # new in 3.4, on 3.3 only highlights() is timed
+    tracemalloc = None
+
+ATTRS = [
+    {'foreground': 0xd70000},
+    {'foreground': 0x005fff, 'bold': True},
+    {'background': 0x303030},
+    {'foreground': 0xaf87ff, 'underline': True},
+    {},
+]
+
+
+class LegacyCell:
+    # Cell before interning
+    def __init__(self, c=' '):
+        self.c = c
+        self.highlight = {}
+
+
+class LegacyHighlight:
+    def __init__(self, line, highlight):
+        self.line = line
+        self.highlight = highlight
+        self.start = 0
+        self.end = 0
+
+
+class LegacyScreen:
+    # the parts of Screen before interning that this batch exercises
+    def __init__(self):
+        self.x = self.y = 0
+        self.highlight = {}
+
+    def resize(self, w, h):
+        self.w, self.h = w, h
+        self.screen = [[LegacyCell() for x in range(w)] for y in range(h)]
+
+    def redraw(self, updates):
+        for cmd in updates:
+            name, args = cmd[0], cmd[1:]
+            if name == 'cursor_goto':
+                self.y, self.x = args[0]
+            elif name == 'highlight_set':
+                self.highlight = args[0][0]
+            elif name == 'put':
+                for cs in args:
+                    for c in cs:
+                        cell = self.screen[self.y][self.x]
+                        cell.c = c
+                        cell.highlight = self.highlight
+                        self.x += 1
+
+    def highlights(self):
+        hlset = []
+        for y, line in enumerate(self.screen):
+            cur = {}
+            h = None
+            for x, cell in enumerate(line):
+                if h and cur and cell.highlight == cur:
+                    h.end = x + 1
+                else:
+                    cur = cell.highlight
+                    if cur:
+                        h = LegacyHighlight(y, cur)
+                        h.start = x
+                        h.end = x + 1
+                        hlset.append(h)
+        return hlset
+
+
+def repaint(w, h, run):
+    # one redraw batch covering the whole screen, `run` cells per highlight
+    updates = []
+    for y in range(h):
+        updates.append(['cursor_goto', [y, 0]])
+        for x in range(0, w, run):
+            attrs = dict(ATTRS[(x // run + y) % len(ATTRS)])
+            updates.append(['highlight_set', [attrs]])
+            updates.append(['put'] + [['x'] for _ in range(min(run, w - x))])
+    return updates
+
+
+def measure(cls, args):
+    # bytes held by a painted screen (None without tracemalloc), and ms per highlights() call
+    held = None
+    if tracemalloc:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+    screen = cls()
+    screen.resize(args.width, args.height)
+    updates = repaint(args.width, args.height, args.run)
+    screen.redraw(updates)
+    del updates
+    if tracemalloc:
+        held = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        spans = screen.highlights()
+    elapsed = time.perf_counter() - start
+    return held, elapsed / args.repeat * 1000, len(spans)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--height', type=int, default=80)
+    parser.add_argument('--run', type=int, default=4, help='cells per highlight_set')
+    parser.add_argument('--repeat', type=int, default=20, help='highlights() calls to time')
+    args = parser.parse_args()
+
+    cells = args.width * args.height
+    print('{}x{} screen, {} cells per highlight_set'.format(args.width, args.height, args.run))
+    if not tracemalloc:
+        print('no tracemalloc (Python 3.4+), skipping the memory report')
+    for name, cls in (('before', LegacyScreen), ('after', Screen)):
+        held, ms, spans = measure(cls, args)
+        memory = '{:10,} bytes {:6.1f} bytes/cell   '.format(held, held / cells) if held is not None else ''
+        print('{:<7} {}highlights() {:.2f} ms, {} spans'.format(name, memory, ms, spans))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+# make the repo importable as the "ActualVim" package, like Sublime does,
+# with the sublime/sublime_plugin stand-ins from this directory on sys.path
+
+import os
+import sys
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+if 'ActualVim' not in sys.modules:
+    pkg = types.ModuleType('ActualVim')
+    pkg.__path__ = [ROOT]
+    sys.modules['ActualVim'] = pkg
@@ -0,0 +1,53 @@
+"""Replay a recorded redraw stream through Screen.
+
+Recordings come from the "ActualVim: Start/Stop Recording Redraws" commands.
+Batches are fed through screen.Screen at full speed to measure redraw
+throughput, or up to a given batch to reproduce a screen state.
+
+    python bench/replay.py recording.msgpack [--repeat N] [--until BATCH] [--show]
+"""
+import argparse
+import time
+
+import package
+from ActualVim.recorder import read
+from ActualVim.screen import Screen
+
+
+def replay(size, batches):
+    screen = Screen()
+    screen.resize(*size)
+    for _, method, args in batches:
+        screen.redraw(args)
+    return screen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path')
+    parser.add_argument('--repeat', type=int, default=10, help='replay the stream this many times')
+    parser.add_argument('--until', type=int, help='stop after this many batches')
+    parser.add_argument('--show', action='store_true', help='print the final screen')
+    args = parser.parse_args()
+
+    size, batches = read(args.path)
+    if args.until is not None:
+        batches = batches[:args.until]
+    events = sum(len(cmd) - 1 for _, _, data in batches for cmd in data)
+
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        screen = replay(size, batches)
+    elapsed = time.perf_counter() - start
+
+    print('{} batches, {} events, {}x{} screen'.format(len(batches), events, *size))
+    print('{:.1f} ms per replay, {:.0f} events/s, {:.0f} batches/s'.format(
+        elapsed / args.repeat * 1000,
+        events * args.repeat / elapsed,
+        len(batches) * args.repeat / elapsed))
+    if args.show:
+        screen.p()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""Headless end-to-end benchmarks for ActualVim.
+
+Drives a real `nvim --embed` through neo.Vim and view.ActualVim, with the
+in-memory `sublime`/`sublime_plugin` stand-ins from this directory in place
+of the editor. Every scenario reports per-operation latency and the number
+of msgpack-rpc calls it cost.
+
+    python bench/run.py [--nvim PATH] [--instances N] [--json out.json] [--compare base.json] [scenario ...]
+
+Use the Python version Sublime Text 3 embeds (3.3), or anything up to 3.6:
+the vendored neovim client passes `async=` as a keyword argument.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+import package
+import sublime
+import sublime_plugin
+
+from ActualVim import actual, edit, neo
+from ActualVim.latency import Histogram
+from ActualVim.view import ActualVim
+
+
+def lorem(lines, width=72):
+    words = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor'.split()
+    out = []
+    for i in range(lines):
+        line = []
+        n = i
+        while sum(len(w) + 1 for w in line) < width:
+            line.append(words[n % len(words)])
+            n += 7
+        out.append(' '.join(line))
+    return '\n'.join(out)
+
+
+class Run:
+    def __init__(self, name):
+        self.name = name
+        self.hist = Histogram(size=None)
+        self.start = None
+
+    def __enter__(self):
+        for inst in neo.instances:
+            inst.profiler.reset()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        sublime.pump(wait=True)
+        # every instance in the pool, including ones started during the run
+        self.rpc = [inst.rpc_snapshot() for inst in neo.instances]
+
+    def op(self, fn, *args, pump=True):
+        t = time.perf_counter()
+        fn(*args)
+        self.hist.add((time.perf_counter() - t) * 1000)
+        if pump:
+            sublime.pump()
+
+    def press(self, view, keys, pump=True):
+        for key in keys:
+            self.op(view.run_command, 'actual_keypress', {'key': key}, pump=pump)
+
+    def result(self):
+        methods = [m for rpc in self.rpc for m in rpc['methods'].values()]
+        calls = sum(m['calls'] + m['notifies'] for m in methods)
+        ret = self.hist.percentiles()
+        ret.update({
+            'total_ms': self.elapsed * 1000,
+            'rpc_calls': calls,
+            'rpc_per_op': calls / max(1, ret['count']),
+            'rpc_bytes': sum(m['request_bytes'] + m['response_bytes'] for m in methods),
+        })
+        return ret
+
+
+def bench_typing(win):
+    view = win.new_file()
+    keys = ['i']
+    for i in range(1, 10001):
+        keys.append('<enter>' if i % 80 == 0 else chr(ord('a') + i % 26))
+    keys.append('<esc>')
+    with Run('typing') as run:
+        run.press(view, keys)
+    win.close(view)
+    return run
+
+
+def bench_delete_put(win):
+    view = win.new_file(lorem(100000))
+    with Run('delete_put') as run:
+        run.press(view, ['d', 'd', 'p', 'j'] * 25)
+    win.close(view)
+    return run
+
+
+def bench_visual_block(win):
+    view = win.new_file(lorem(5000))
+    with Run('visual_block') as run:
+        run.press(view, ['<c-v>'] + ['j'] * 1000 + ['l'] * 40 + ['<esc>'])
+    win.close(view)
+    return run
+
+
+def bench_scroll(win):
+    view = win.new_file(lorem(20000))
+    with Run('scroll') as run:
+        run.press(view, ['<c-d>'] * 200 + ['<c-u>'] * 200)
+    win.close(view)
+    return run
+
+
+def bench_buffers(win):
+    text = lorem(200)
+    with Run('buffers') as run:
+        views = []
+        for i in range(200):
+            run.op(lambda: views.append(win.new_file(text)))
+        for view in views:
+            run.op(win.focus_view, view)
+    for view in views:
+        win.close(view)
+    return run
+
+
+def bench_windows(win):
+    # 8 windows typing at once, each from its own thread; with --instances 8
+    # every window gets its own nvim, otherwise they all share one channel
+    # each keystroke activates its view first, so with a shared nvim every key also pays
+    # for switching buffers, and the same work is measured for any pool size
+    views = [win.new_file()] + [sublime.new_window().new_file() for i in range(7)]
+    keys = ['i'] + [chr(ord('a') + i % 26) for i in range(1000)] + ['<esc>']
+    locks = {}
+
+    def focus_press(view, key):
+        av = ActualVim.get(view)
+        # activate + keypress must not interleave with another view on the same nvim
+        with locks.setdefault(id(av.vim), threading.Lock()):
+            av.activate()
+            view.run_command('actual_keypress', {'key': key})
+
+    def typist(run, view):
+        for key in keys:
+            run.op(focus_press, view, key, pump=False)
+
+    with Run('windows') as run:
+        threads = [threading.Thread(target=typist, args=(run, view)) for view in views]
+        for t in threads:
+            t.start()
+        # timeouts (deferred edits) still run on the main thread, like sublime
+        while any(t.is_alive() for t in threads):
+            sublime.pump()
+            time.sleep(0.001)
+    for view in views:
+        view.window().close(view)
+    return run
+
+
+SCENARIOS = {
+    'typing': bench_typing,
+    'delete_put': bench_delete_put,
+    'visual_block': bench_visual_block,
+    'scroll': bench_scroll,
+    'buffers': bench_buffers,
+    'windows': bench_windows,
+}
+ORDER = ['typing', 'delete_put', 'visual_block', 'scroll', 'buffers', 'windows']
+
+
+def setup(nvim, instances):
+    for module in (actual, edit):
+        sublime_plugin.load_module(module)
+    # ActualVim.enable() needs an active view once nvim is up
+    sublime.active_window().new_file()
+
+    s = sublime.load_settings('ActualVim.sublime-settings')
+    if nvim:
+        s.set('neovim_path', nvim)
+    s.set('large_file_disable', {'bytes': -1, 'lines': -1})
+    s.set('rpc_profile', True)
+    s.set('neovim_instances', instances)
+    s.set('instance_assign', 'window')
+    neo.plugin_loaded()
+    if not neo._loaded:
+        raise SystemExit('nvim failed to start')
+    sublime.pump(wait=True)
+
+
+def compare(results, path, tolerance):
+    with open(path) as f:
+        base = json.load(f)
+    failed = False
+    for name, res in sorted(results.items()):
+        old = base.get(name)
+        if not old:
+            continue
+        for key in ('p95', 'rpc_per_op'):
+            if old.get(key) and res[key] > old[key] * (1 + tolerance):
+                print('REGRESSION {}: {} {:.2f} -> {:.2f}'.format(name, key, old[key], res[key]))
+                failed = True
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('scenarios', nargs='*', help='any of: ' + ', '.join(ORDER))
+    parser.add_argument('--nvim', help='nvim binary (default: neovim_path setting or $PATH)')
+    parser.add_argument('--instances', type=int, default=1, help='size of the nvim pool (neovim_instances)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='baseline results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing --compare')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: ' + name)
+
+    setup(args.nvim, args.instances)
+    results = {}
+    try:
+        win = sublime.active_window()
+        for name in args.scenarios or ORDER:
+            run = SCENARIOS[name](win)
+            res = results[name] = run.result()
+            print('{:<13} ops={count:<6} p50={p50:7.2f}ms p95={p95:7.2f}ms p99={p99:7.2f}ms '
+                  'total={total_ms:9.1f}ms rpc/op={rpc_per_op:6.2f} rpc_bytes={rpc_bytes}'.format(name, **res))
+    finally:
+        neo.plugin_unloaded()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
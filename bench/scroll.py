@@ -0,0 +1,83 @@
+"""Replay a synthetic <c-d> storm through Screen.
+
+Builds the redraw batches nvim sends for repeated <c-d> on a tall window:
+each one scrolls the window's region by half its height and repaints the
+rows that came into view, plus the status and command lines. Reports how
+long Screen takes per scroll, or saves the batches as a recording that
+bench/replay.py can read.
+
+    python bench/scroll.py [--rows N] [--width W] [--scrolls N] [--scroll-only] [--save recording.msgpack]
+"""
+import argparse
+import time
+
+import package
+from ActualVim.lib import msgpack
+from ActualVim.recorder import MAGIC, VERSION
+from ActualVim.screen import Screen
+
+TEXT = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+
+
+def ctrl_d(rows, width, top, paint=True):
+    # one <c-d>: scroll the window region (rows lines tall, inclusive bounds) by half, then paint what's new
+    half = rows // 2
+    batch = [
+        ['set_scroll_region', [0, rows - 1, 0, width - 1]],
+        ['scroll', [half]],
+        ['set_scroll_region', [0, rows + 1, 0, width - 1]],
+    ]
+    if not paint:
+        return batch
+    for y in range(rows - half, rows):
+        n = top + y
+        line = (TEXT * (width // len(TEXT) + 1))[n % len(TEXT):][:width - 8]
+        batch.append(['cursor_goto', [y, 0]])
+        batch.append(['highlight_set', [{'foreground': 0x808080}]])
+        batch.append(['put'] + [[c] for c in '{:>6} '.format(n + 1)])
+        batch.append(['highlight_set', [{}]])
+        batch.append(['put'] + [[c] for c in line])
+        batch.append(['eol_clear', []])
+    status = 'bench.txt{:>{}}'.format('{},1'.format(top + half + 1), width - 9)
+    batch.append(['cursor_goto', [rows, 0]])
+    batch.append(['highlight_set', [{'reverse': True, 'bold': True}]])
+    batch.append(['put'] + [[c] for c in status])
+    batch.append(['cursor_goto', [half, 7]])
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=200, help='window height')
+    parser.add_argument('--width', type=int, default=120)
+    parser.add_argument('--scrolls', type=int, default=100, help='<c-d> presses')
+    parser.add_argument('--repeat', type=int, default=3, help='replay the storm this many times')
+    parser.add_argument('--scroll-only', action='store_true', help="don't repaint the rows scrolled into view")
+    parser.add_argument('--save', help='write the batches as a redraw recording')
+    args = parser.parse_args()
+
+    # window, status line and command line
+    size = (args.width, args.rows + 2)
+    batches = [ctrl_d(args.rows, args.width, i * (args.rows // 2), not args.scroll_only) for i in range(args.scrolls)]
+
+    if args.save:
+        with open(args.save, 'wb') as f:
+            f.write(msgpack.packb([MAGIC, VERSION] + list(size)))
+            for i, batch in enumerate(batches):
+                f.write(msgpack.packb([i / 60, 'redraw', batch]))
+
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        screen = Screen()
+        screen.resize(*size)
+        for batch in batches:
+            screen.redraw(batch)
+    elapsed = time.perf_counter() - start
+
+    n = args.scrolls * args.repeat
+    print('{}x{} screen, {} scrolls of {} rows'.format(size[0], size[1], args.scrolls, args.rows // 2))
+    print('{:.3f} ms per <c-d>, {:.0f} scrolls/s'.format(elapsed / n * 1000, n / elapsed))
+
+
+if __name__ == '__main__':
+    main()
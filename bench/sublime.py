@@ -0,0 +1,441 @@
+# in-memory stand-in for the parts of the Sublime Text 3 API ActualVim uses
+# just enough to drive neo.Vim and view.ActualVim headlessly for benchmarks
+
+import bisect
+import heapq
+import itertools
+import re
+import threading
+import time
+import traceback
+
+DRAW_NO_OUTLINE = 256
+INHIBIT_WORD_COMPLETIONS = 8
+INHIBIT_EXPLICIT_COMPLETIONS = 16
+
+
+def version():
+    return '3211'
+
+
+def platform():
+    return 'linux'
+
+
+def packages_path():
+    return '/tmp/actualvim-bench/Packages'
+
+
+def cache_path():
+    return '/tmp/actualvim-bench/Cache'
+
+
+class Region:
+    __slots__ = ('a', 'b', 'xpos')
+
+    def __init__(self, a, b=None, xpos=-1):
+        if b is None:
+            b = a
+        self.a = a
+        self.b = b
+        self.xpos = xpos
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.a - self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def cover(self, r):
+        if self.a > self.b:
+            return Region(max(self.a, r.end()), min(self.b, r.begin()))
+        return Region(min(self.a, r.begin()), max(self.b, r.end()))
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def intersects(self, r):
+        return self.begin() < r.end() and r.begin() < self.end()
+
+    def __len__(self):
+        return self.size()
+
+    def __eq__(self, r):
+        return isinstance(r, Region) and (self.a, self.b) == (r.a, r.b)
+
+    def __lt__(self, r):
+        return self.begin() < r.begin()
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __repr__(self):
+        return '({}, {})'.format(self.a, self.b)
+
+
+class Selection:
+    def __init__(self):
+        self.regions = []
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, i):
+        return self.regions[i]
+
+    def __iter__(self):
+        return iter(list(self.regions))
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, r):
+        if isinstance(r, int):
+            r = Region(r)
+        self.regions.append(r)
+        self.regions.sort()
+
+    def add_all(self, regions):
+        for r in regions:
+            self.add(r)
+
+    def subtract(self, r):
+        self.regions = [s for s in self.regions if not r.contains(s)]
+
+
+class Settings:
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+        for cb in list(self.callbacks.values()):
+            set_timeout(cb, 0)
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def has(self, key):
+        return key in self.values
+
+    def add_on_change(self, key, cb):
+        self.callbacks[key] = cb
+
+    def clear_on_change(self, key):
+        self.callbacks.pop(key, None)
+
+
+_view_ids = itertools.count(1)
+
+
+class View:
+    def __init__(self, window, text='', path=None):
+        self._id = next(_view_ids)
+        self._window = window
+        self._text = text
+        self._lines = None
+        self._path = path
+        self._name = ''
+        self._sel = Selection()
+        self._sel.add(Region(0))
+        self._settings = Settings()
+        self._change_count = 0
+        self._read_only = False
+        self._dirty = False
+        self._regions = {}
+        self._status = {}
+        self._popup = None
+        self._viewport = (800.0, 600.0)
+        self._top = 0
+        self.listeners = []
+
+    def id(self):
+        return self._id
+
+    def window(self):
+        return self._window
+
+    def settings(self):
+        return self._settings
+
+    def file_name(self):
+        return self._path
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def is_dirty(self):
+        return self._dirty
+
+    def is_read_only(self):
+        return self._read_only
+
+    def set_read_only(self, ro):
+        self._read_only = ro
+
+    def change_count(self):
+        return self._change_count
+
+    # text
+    def size(self):
+        return len(self._text)
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self._text[x.begin():x.end()]
+        return self._text[x:x + 1]
+
+    def _line_starts(self):
+        if self._lines is None:
+            self._lines = [0] + [m.end() for m in re.finditer('\n', self._text)]
+        return self._lines
+
+    def _modify(self, text):
+        self._text = text
+        self._lines = None
+        self._change_count += 1
+        self._dirty = True
+
+    def insert(self, edit, point, text):
+        self._modify(self._text[:point] + text + self._text[point:])
+        return len(text)
+
+    def erase(self, edit, r):
+        self._modify(self._text[:r.begin()] + self._text[r.end():])
+
+    def replace(self, edit, r, text):
+        self._modify(self._text[:r.begin()] + text + self._text[r.end():])
+
+    def rowcol(self, point):
+        starts = self._line_starts()
+        row = bisect.bisect_right(starts, point) - 1
+        return row, point - starts[row]
+
+    def text_point(self, row, col):
+        starts = self._line_starts()
+        row = max(0, min(row, len(starts) - 1))
+        return min(starts[row] + col, self.size())
+
+    def line(self, x):
+        if isinstance(x, Region):
+            a = self.line(x.begin())
+            b = self.line(x.end())
+            return Region(a.a, b.b)
+        starts = self._line_starts()
+        row = bisect.bisect_right(starts, x) - 1
+        end = starts[row + 1] - 1 if row + 1 < len(starts) else self.size()
+        return Region(starts[row], end)
+
+    def full_line(self, x):
+        r = self.line(x)
+        return Region(r.a, min(r.b + 1, self.size()))
+
+    def lines(self, r):
+        starts = self._line_starts()
+        first, _ = self.rowcol(r.begin())
+        last, _ = self.rowcol(r.end())
+        return [self.line(starts[i]) for i in range(first, last + 1)]
+
+    def word(self, x):
+        point = x.begin() if isinstance(x, Region) else x
+        a = b = point
+        while a > 0 and re.match(r'\w', self._text[a - 1]):
+            a -= 1
+        while b < self.size() and re.match(r'\w', self._text[b]):
+            b += 1
+        return Region(a, b)
+
+    def extract_completions(self, prefix, point=None):
+        words = re.findall(r'\b{}\w+'.format(re.escape(prefix)), self._text)
+        return sorted(set(words))
+
+    def sel(self):
+        return self._sel
+
+    # layout
+    def viewport_extent(self):
+        return self._viewport
+
+    def set_viewport_extent(self, w, h):
+        self._viewport = (w, h)
+
+    def em_width(self):
+        return 8.0
+
+    def line_height(self):
+        return 16.0
+
+    def visible_region(self):
+        rows = int(self._viewport[1] / self.line_height())
+        a = self.text_point(self._top, 0)
+        b = self.line(self.text_point(self._top + rows - 1, 0)).b
+        return Region(a, b)
+
+    def show(self, x, show_surrounds=True):
+        if isinstance(x, Selection):
+            x = x[0]
+        point = x.b if isinstance(x, Region) else x
+        rows = int(self._viewport[1] / self.line_height())
+        row, _ = self.rowcol(point)
+        if row < self._top or row >= self._top + rows:
+            self._top = max(0, row - rows // 2)
+
+    # decorations
+    def add_regions(self, key, regions, scope='', icon='', flags=0):
+        self._regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return self._regions.get(key, [])
+
+    def erase_regions(self, key):
+        self._regions.pop(key, None)
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def is_popup_visible(self):
+        return self._popup is not None
+
+    def show_popup(self, content, flags=0, location=-1, max_width=320, max_height=240, on_navigate=None, on_hide=None):
+        self._popup = content
+
+    def update_popup(self, content):
+        self._popup = content
+
+    def hide_popup(self):
+        self._popup = None
+
+    def run_command(self, name, args=None):
+        import sublime_plugin
+        sublime_plugin.run_text_command(self, name, args or {})
+
+
+_window_ids = itertools.count(1)
+
+
+class Window:
+    def __init__(self):
+        self._id = next(_window_ids)
+        self._views = []
+        self._active = None
+
+    def id(self):
+        return self._id
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._active
+
+    def new_file(self, text='', path=None):
+        import sublime_plugin
+        view = View(self, text, path)
+        view._dirty = False
+        self._views.append(view)
+        self._active = view
+        sublime_plugin.on_new(view)
+        sublime_plugin.on_activated(view)
+        return view
+
+    def focus_view(self, view):
+        import sublime_plugin
+        if self._active is not view:
+            self._active = view
+            sublime_plugin.on_activated(view)
+
+    def close(self, view):
+        import sublime_plugin
+        sublime_plugin.on_pre_close(view)
+        self._views.remove(view)
+        if self._active is view:
+            self._active = self._views[-1] if self._views else None
+
+    def run_command(self, name, args=None):
+        pass
+
+
+_windows = [Window()]
+
+
+def active_window():
+    return _windows[0]
+
+
+def windows():
+    return list(_windows)
+
+
+def new_window():
+    # stands in for run_command('new_window'); the first window stays active
+    win = Window()
+    _windows.append(win)
+    return win
+
+
+_settings = {}
+
+
+def load_settings(name):
+    s = _settings.get(name)
+    if s is None:
+        s = _settings[name] = Settings()
+    return s
+
+
+def save_settings(name):
+    pass
+
+
+# timeouts are queued and run by pump(), which the benchmark calls between keys
+_timeouts = []
+_timeout_seq = itertools.count()
+_timeout_lock = threading.Lock()
+
+
+def set_timeout(fn, delay=0):
+    with _timeout_lock:
+        heapq.heappush(_timeouts, (time.time() + delay / 1000.0, next(_timeout_seq), fn))
+
+
+set_timeout_async = set_timeout
+
+
+def pump(wait=False):
+    # run every due callback; with wait=True, keep going until the queue is empty
+    while True:
+        with _timeout_lock:
+            if not _timeouts:
+                return
+            due, _, fn = _timeouts[0]
+            if due > time.time():
+                if not wait:
+                    return
+                fn = None
+            else:
+                heapq.heappop(_timeouts)
+        if fn is None:
+            time.sleep(max(0, due - time.time()))
+            continue
+        try:
+            fn()
+        except Exception:
+            traceback.print_exc()
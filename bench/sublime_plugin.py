@@ -0,0 +1,141 @@
+# in-memory stand-in for sublime_plugin: command dispatch and event listeners
+
+import inspect
+import re
+import threading
+import traceback
+
+import sublime
+
+text_commands = {}
+application_commands = {}
+event_listeners = []
+view_listener_classes = []
+
+# nested run_command calls don't fire on_text_command/on_post_text_command
+# (per thread, so concurrent benchmarks can drive separate views)
+_local = threading.local()
+
+
+class Command:
+    def is_enabled(self):
+        return True
+
+
+class ApplicationCommand(Command):
+    pass
+
+
+class WindowCommand(Command):
+    def __init__(self, window):
+        self.window = window
+
+
+class TextCommand(Command):
+    def __init__(self, view):
+        self.view = view
+
+
+class EventListener:
+    pass
+
+
+class ViewEventListener:
+    @classmethod
+    def is_applicable(cls, settings):
+        return True
+
+    def __init__(self, view):
+        self.view = view
+
+
+def command_name(cls):
+    name = cls.__name__
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    return re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name).lower()
+
+
+def load_module(module):
+    # register every command and listener defined in `module`, like sublime does on plugin load
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if cls.__module__ != module.__name__:
+            continue
+        if issubclass(cls, TextCommand):
+            text_commands[command_name(cls)] = cls
+        elif issubclass(cls, ApplicationCommand):
+            application_commands[command_name(cls)] = cls
+        elif issubclass(cls, ViewEventListener):
+            view_listener_classes.append(cls)
+        elif issubclass(cls, EventListener):
+            event_listeners.append(cls())
+
+
+def _emit(name, *args):
+    for listener in event_listeners:
+        fn = getattr(listener, name, None)
+        if fn:
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+
+
+def _emit_view(view, name):
+    for listener in view.listeners:
+        fn = getattr(listener, name, None)
+        if fn:
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+
+
+def on_new(view):
+    view.listeners = [cls(view) for cls in view_listener_classes if cls.is_applicable(view.settings())]
+    _emit('on_new', view)
+
+
+def on_activated(view):
+    _emit_view(view, 'on_activated')
+
+
+def on_pre_close(view):
+    _emit('on_pre_close', view)
+
+
+def run_text_command(view, name, args):
+    cls = text_commands.get(name)
+    if not cls:
+        return
+    depth = getattr(_local, 'depth', 0)
+    top = not depth
+    if top:
+        _emit('on_text_command', view, name, args)
+    change_count = view.change_count()
+    sel = [(r.a, r.b) for r in view.sel()]
+
+    _local.depth = depth + 1
+    try:
+        cmd = cls(view)
+        if cmd.is_enabled():
+            cmd.run(object(), **args)
+    finally:
+        _local.depth = depth
+
+    if top:
+        if view.change_count() != change_count:
+            _emit_view(view, 'on_modified')
+        if [(r.a, r.b) for r in view.sel()] != sel:
+            _emit_view(view, 'on_selection_modified')
+        _emit('on_post_text_command', view, name, args)
+
+
+def run_application_command(name, args=None):
+    cls = application_commands.get(name)
+    if cls:
+        cls().run(**(args or {}))
+
+
+def on_query_completions(view_id, prefix, locations):
+    return [], 0
@@ -0,0 +1,104 @@
+"""Compare msgpack-rpc event loop backends on a child process's pipes.
+
+The child is a small Python process standing in for `nvim --embed`, so this
+runs without nvim and measures only the transport and unpacking:
+
+- flood: the child writes a burst of redraw-sized notifications, which is
+  what a full screen repaint or scroll looks like from the plugin's side.
+- echo: the child echoes each request back, one message in flight at a time,
+  to measure round-trip latency.
+
+    python bench/transport.py [--messages N] [--size BYTES] [--roundtrips N]
+"""
+import argparse
+import binascii
+import sys
+import time
+
+import package
+from ActualVim.lib import msgpack
+from ActualVim.lib.neovim.msgpack_rpc import MsgpackStream
+from ActualVim.lib.neovim.msgpack_rpc.event_loop.asyncio import AsyncioEventLoop
+
+LOOPS = [('asyncio', AsyncioEventLoop)]
+if sys.platform.startswith('linux'):
+    from ActualVim.lib.neovim.msgpack_rpc.event_loop.pipe import PipeEventLoop
+    LOOPS.append(('pipe', PipeEventLoop))
+
+FLOOD = '''
+import binascii, os, sys
+data = binascii.unhexlify(sys.argv[1]) * int(sys.argv[2])
+out = sys.stdout.fileno()
+view = memoryview(data)
+while view:
+    view = view[os.write(out, view[:1 << 20]):]
+sys.stdin.read()
+'''
+
+ECHO = '''
+import os, sys
+inp, out = sys.stdin.fileno(), sys.stdout.fileno()
+while True:
+    data = os.read(inp, 1 << 16)
+    if not data:
+        break
+    os.write(out, data)
+'''
+
+
+def redraw_batch(size):
+    # one 'put' per cell, roughly what nvim sends to paint `size` bytes of text
+    cells = [[c] for c in ('x' * max(1, size // 3))]
+    return msgpack.packb([2, 'redraw', [['cursor_goto', [0, 0]], ['put'] + cells]])
+
+
+def flood(cls, messages, size):
+    data = redraw_batch(size)
+    argv = [sys.executable, '-c', FLOOD, binascii.hexlify(data).decode(), str(messages)]
+    stream = MsgpackStream(cls('child', argv))
+    count = [0]
+
+    def on_message(msg):
+        count[0] += 1
+        if count[0] == messages:
+            stream.stop()
+
+    start = time.perf_counter()
+    stream.run(on_message)
+    elapsed = time.perf_counter() - start
+    return '{:8.1f} ms {:8.0f} msg/s {:7.1f} MB/s'.format(
+        elapsed * 1000, messages / elapsed, len(data) * messages / elapsed / 1e6)
+
+
+def echo(cls, roundtrips):
+    stream = MsgpackStream(cls('child', [sys.executable, '-c', ECHO]))
+    count = [0]
+
+    def on_message(msg):
+        count[0] += 1
+        if count[0] == roundtrips:
+            stream.stop()
+        else:
+            stream.send([0, count[0], 'nvim_eval', ['1']])
+
+    stream.send([0, 0, 'nvim_eval', ['1']])
+    start = time.perf_counter()
+    stream.run(on_message)
+    elapsed = time.perf_counter() - start
+    return '{:8.1f} ms {:8.1f} us/roundtrip'.format(elapsed * 1000, elapsed / roundtrips * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--messages', type=int, default=500, help='notifications to flood')
+    parser.add_argument('--size', type=int, default=4096, help='approximate bytes per notification')
+    parser.add_argument('--roundtrips', type=int, default=5000, help='requests to echo')
+    args = parser.parse_args()
+
+    for name, cls in LOOPS:
+        print('{:<8} flood {}'.format(name, flood(cls, args.messages, args.size)))
+        print('{:<8} echo  {}'.format(name, echo(cls, args.roundtrips)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import bisect
+import re
+import sublime
+import sublime_plugin
+import threading
+import time
+
+WORD_RE = re.compile(r'\w{2,}')
+SNIPPET_RE = re.compile(r'\$\{\d+:?([^}]*)\}|\$\d+')
+
+
+class WordIndex:
+    # word -> occurrence count, plus a sorted word list for prefix lookups
+    def __init__(self):
+        self.lines = []
+        self.counts = {}
+        self.words = []
+        self.change_count = None
+
+    def update(self, text, change_count):
+        if change_count == self.change_count:
+            return
+        lines = text.split('\n')
+        old = self.lines
+
+        # only re-index the lines between the common prefix and suffix
+        n = min(len(old), len(lines))
+        pre = 0
+        while pre < n and old[pre] == lines[pre]:
+            pre += 1
+        post = 0
+        while post < n - pre and old[-1 - post] == lines[-1 - post]:
+            post += 1
+
+        added, removed = set(), set()
+        for line in old[pre:len(old) - post]:
+            for word in WORD_RE.findall(line):
+                count = self.counts[word] - 1
+                if count:
+                    self.counts[word] = count
+                else:
+                    del self.counts[word]
+                    removed.add(word)
+        for line in lines[pre:len(lines) - post]:
+            for word in WORD_RE.findall(line):
+                count = self.counts.get(word, 0)
+                if not count:
+                    added.add(word)
+                self.counts[word] = count + 1
+
+        # words that vanished and came back in the same update are a no-op
+        # lookups may be running on another thread, so swap in a new list instead of mutating
+        added, removed = added - removed, removed - added
+        if len(added) + len(removed) > len(self.words) // 8:
+            words = sorted(self.counts)
+        else:
+            words = list(self.words)
+            for word in removed:
+                i = bisect.bisect_left(words, word)
+                if i < len(words) and words[i] == word:
+                    del words[i]
+            for word in added:
+                bisect.insort(words, word)
+        self.words = words
+
+        self.lines = lines
+        self.change_count = change_count
+
+    def lookup(self, prefix, limit):
+        words = self.words
+        i = bisect.bisect_left(words, prefix)
+        ret = []
+        while i < len(words) and words[i].startswith(prefix) and len(ret) < limit:
+            if words[i] != prefix:
+                ret.append(words[i])
+            i += 1
+        return ret
+
+
+def vim_item(completion):
+    # convert a sublime completion into a vim complete-item
+    if isinstance(completion, str):
+        return completion
+    trigger, contents = completion[0], completion[1]
+    abbr, _, menu = trigger.partition('\t')
+    return {
+        'word': SNIPPET_RE.sub(lambda m: m.group(1) or '', contents),
+        'abbr': abbr,
+        'menu': menu,
+    }
+
+
+class Completer:
+    def __init__(self, view):
+        self.view = view
+        self.index = WordIndex()
+        self.lock = threading.Lock()
+        self.worker = None
+        self.used = False
+
+        # (change count, base) -> vim complete items
+        self.cache = {}
+
+    def modified(self):
+        # the index is only maintained once completion has been used in this view
+        if self.used:
+            self.refresh()
+
+    def refresh(self):
+        # re-index on a background thread, coalescing modifications while one runs
+        with self.lock:
+            if self.worker and self.worker.is_alive():
+                return self.worker
+            self.worker = t = threading.Thread(target=self._reindex)
+            t.daemon = True
+            t.start()
+            return t
+
+    def _reindex(self):
+        view = self.view
+        while True:
+            change_count = view.change_count()
+            if change_count == self.index.change_count:
+                break
+            text = view.substr(sublime.Region(0, view.size()))
+            self.index.update(text, change_count)
+
+    def complete(self, base, loc, timeout):
+        self.used = True
+        change_count = self.view.change_count()
+        key = (change_count, base)
+        ret = self.cache.get(key)
+        if ret is not None:
+            return ret
+
+        deadline = time.time() + timeout
+        worker = self.refresh()
+
+        # plugin completions run on their own thread so a slow plugin can't stall vim past the budget
+        plugin = {}
+
+        def query():
+            plugin['ret'] = sublime_plugin.on_query_completions(self.view.id(), base, [loc])
+
+        t = threading.Thread(target=query)
+        t.daemon = True
+        t.start()
+        t.join(max(0, deadline - time.time()))
+        completions, flags = plugin.get('ret', ([], 0))
+        ret = [vim_item(c) for c in completions]
+
+        if not flags & sublime.INHIBIT_WORD_COMPLETIONS:
+            # a stale index is still better than blowing the budget
+            worker.join(max(0, deadline - time.time()))
+            ret += self.index.lookup(base, 1000)
+
+        # TODO: .sublime-completion support?
+        if not flags & sublime.INHIBIT_EXPLICIT_COMPLETIONS:
+            pass
+
+        # only cache complete answers, and only for the current change count
+        if 'ret' in plugin and self.index.change_count == change_count:
+            self.cache = {k: v for k, v in self.cache.items() if k[0] == change_count}
+            self.cache[key] = ret
+        return ret
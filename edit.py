@@ -2,14 +2,30 @@
 # buffer editing for both ST2 and ST3 that "just works"
 
 import inspect
+import itertools
 import sublime
 import sublime_plugin
+import threading
 
 try:
     sublime.actualvim_edit_storage
 except AttributeError:
     sublime.actualvim_edit_storage = {}
 
+# monotonic keys, so two edits in flight never share a storage slot
+try:
+    sublime.actualvim_edit_keys
+except AttributeError:
+    sublime.actualvim_edit_keys = itertools.count()
+
+# view id -> (view, [(key, callback)]) deferred until the next ui tick
+try:
+    sublime.actualvim_edit_pending
+except AttributeError:
+    sublime.actualvim_edit_pending = {}
+
+_pending_lock = threading.Lock()
+
 def run_callback(func, *args, **kwargs):
     spec = inspect.getfullargspec(func)
     if spec.args or spec.varargs:
@@ -71,9 +87,29 @@ class Edit:
         return EditFuture(func)
 
     @classmethod
-    def defer(cls, view, func):
-        with Edit(view) as edit:
-            edit.callback(func)
+    def defer(cls, view, func, key=None):
+        # everything deferred for a view within one ui tick is applied as a single
+        # apply_actualvim_edit (one undo step, one repaint), in the order it was deferred
+        # a later callback with the same key replaces an earlier one
+        with _pending_lock:
+            pending = sublime.actualvim_edit_pending.get(view.id())
+            if pending:
+                funcs = pending[1]
+                if key is not None:
+                    funcs[:] = [f for f in funcs if f[0] != key]
+                funcs.append((key, func))
+                return
+            sublime.actualvim_edit_pending[view.id()] = (view, [(key, func)])
+        sublime.set_timeout(lambda: cls.flush(view), 0)
+
+    @classmethod
+    def flush(cls, view):
+        with _pending_lock:
+            pending = sublime.actualvim_edit_pending.pop(view.id(), None)
+        if pending:
+            with Edit(pending[0]) as edit:
+                for _, func in pending[1]:
+                    edit.callback(func)
 
     def step(self, cmd, *args):
         step = EditStep(cmd, *args)
@@ -133,7 +169,7 @@ class Edit:
             self.run(edit)
             view.end_edit(edit)
         else:
-            key = str(hash(tuple(self.steps)))
+            key = str(next(sublime.actualvim_edit_keys))
             sublime.actualvim_edit_storage[key] = self.run
             view.run_command('apply_actualvim_edit', {'key': key})
 
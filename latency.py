@@ -0,0 +1,95 @@
+import collections
+import json
+import time
+
+from . import settings
+
+# stages are recorded as milliseconds since the key was received
+STAGES = ('input', 'ready', 'tick', 'fetch', 'replace', 'select', 'done')
+
+
+class Histogram:
+    # rolling window over the most recent samples
+    def __init__(self, size=1000):
+        self.samples = collections.deque(maxlen=size)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def percentiles(self):
+        s = sorted(self.samples)
+        if not s:
+            return {'count': 0}
+
+        def p(n):
+            return s[min(len(s) - 1, int(len(s) * n / 100))]
+
+        return {
+            'count': len(s),
+            'p50': p(50),
+            'p95': p(95),
+            'p99': p(99),
+            'max': s[-1],
+        }
+
+
+class Tracer:
+    def __init__(self):
+        self.current = None
+        # mode -> stage -> Histogram
+        self.hists = {}
+
+    def start(self, key, mode):
+        if not settings.get('trace_latency', False):
+            self.current = None
+            return
+        self.current = {'key': key, 'mode': mode, 'start': time.perf_counter(), 'marks': []}
+
+    def mark(self, stage):
+        cur = self.current
+        if cur is not None:
+            cur['marks'].append((stage, time.perf_counter()))
+
+    def finish(self):
+        cur, self.current = self.current, None
+        if cur is None:
+            return
+        size = settings.get('trace_window', 1000)
+        stages = self.hists.setdefault(cur['mode'], {})
+        marks = cur['marks'] + [('done', time.perf_counter())]
+        for stage, t in marks:
+            h = stages.get(stage)
+            if h is None:
+                h = stages[stage] = Histogram(size)
+            h.add((t - cur['start']) * 1000)
+
+    def reset(self):
+        self.hists = {}
+
+    def snapshot(self):
+        return {
+            mode: {stage: h.percentiles() for stage, h in stages.items()}
+            for mode, stages in self.hists.items()
+        }
+
+    def report(self):
+        lines = []
+        for mode, stages in sorted(self.snapshot().items()):
+            lines.append('mode {}:'.format(mode))
+            for stage in STAGES:
+                p = stages.get(stage)
+                if p:
+                    lines.append('  {:<8} n={count:<6} p50={p50:7.2f}ms p95={p95:7.2f}ms p99={p99:7.2f}ms max={max:7.2f}ms'.format(stage, **p))
+        return '\n'.join(lines) or 'no samples (set "trace_latency": true)'
+
+    def dump(self, path=None):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+        else:
+            print('ActualVim: keystroke latency')
+            print(self.report())
+
+
+if not 'tracer' in globals():
+    tracer = Tracer()
@@ -5,17 +5,21 @@ handling some Nvim particularities(server->client requests for example), the
 code here should work with other msgpack-rpc servers.
 """
 from .async_session import AsyncSession
-from .event_loop import EventLoop
+from .event_loop import ChildEventLoop, EventLoop
 from .msgpack_stream import MsgpackStream
+from .profiler import RpcProfiler
 from .session import ErrorResponse, Session
 
 
 __all__ = ('tcp_session', 'socket_session', 'stdio_session', 'child_session',
-           'ErrorResponse')
+           'ErrorResponse', 'RpcProfiler')
 
 
 def session(transport_type='stdio', *args, **kwargs):
-    loop = EventLoop(transport_type, *args, **kwargs)
+    if transport_type == 'child' and ChildEventLoop:
+        loop = ChildEventLoop(transport_type, *args, **kwargs)
+    else:
+        loop = EventLoop(transport_type, *args, **kwargs)
     msgpack_stream = MsgpackStream(loop)
     async_session = AsyncSession(msgpack_stream)
     session = Session(async_session)
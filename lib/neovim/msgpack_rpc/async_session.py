@@ -18,6 +18,7 @@ class AsyncSession(object):
         self._next_request_id = 1
         self._pending_requests = {}
         self._request_cb = self._notification_cb = None
+        self._profiler = None
         self._lock = threading.Lock()
         self._handlers = {
             0: self._on_request,
@@ -29,6 +30,10 @@ class AsyncSession(object):
         """Wrapper around `MsgpackStream.threadsafe_call`."""
         self._msgpack_stream.threadsafe_call(fn)
 
+    def set_profiler(self, profiler):
+        """Install an `RpcProfiler` to account for traffic, or None to stop."""
+        self._profiler = profiler
+
     def request(self, method, args, response_cb):
         """Send a msgpack-rpc request to Nvim.
 
@@ -39,8 +44,10 @@ class AsyncSession(object):
         with self._lock:
             request_id = self._next_request_id
             self._next_request_id = request_id + 1
-            self._msgpack_stream.send([0, request_id, method, args])
+            size = self._msgpack_stream.send([0, request_id, method, args])
             self._pending_requests[request_id] = response_cb
+            if self._profiler:
+                self._profiler.on_request(request_id, method, size)
 
     def notify(self, method, args):
         """Send a msgpack-rpc notification to Nvim.
@@ -49,7 +56,9 @@ class AsyncSession(object):
         Nvim. This will have the same effect as a request, but no response
         will be recieved
         """
-        self._msgpack_stream.send([2, method, args])
+        size = self._msgpack_stream.send([2, method, args])
+        if self._profiler:
+            self._profiler.on_notify(method, size)
 
     def run(self, request_cb, notification_cb):
         """Run the event loop to receive requests and notifications from Nvim.
@@ -69,6 +78,8 @@ class AsyncSession(object):
         self._msgpack_stream.stop()
 
     def _on_message(self, msg):
+        if self._profiler:
+            self._profiler.on_message(msg)
         try:
             self._handlers.get(msg[0], self._on_invalid_message)(msg)
         except Exception:
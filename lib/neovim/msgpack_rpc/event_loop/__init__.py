@@ -1,7 +1,12 @@
 """Event loop abstraction subpackage.
 
 Tries to use pyuv as a backend, falling back to the asyncio implementation.
+Without pyuv on Linux, child Nvim instances are driven by `PipeEventLoop`,
+which polls the pipes directly instead of going through asyncio.
 """
+import sys
+
+ChildEventLoop = None
 try:
     # libuv is fully implemented in C, use it when available
     from .uv import UvEventLoop
@@ -12,5 +17,9 @@ except ImportError:
     from .asyncio import AsyncioEventLoop
     EventLoop = AsyncioEventLoop
 
+    if sys.platform.startswith('linux'):
+        from .pipe import PipeEventLoop
+        ChildEventLoop = PipeEventLoop
+
 
-__all__ = ('EventLoop')
+__all__ = ('EventLoop', 'ChildEventLoop')
@@ -0,0 +1,179 @@
+"""Event loop implementation that drives a child Nvim's pipes directly.
+
+This only supports the 'child' transport on Linux. Instead of going through
+the asyncio transport and protocol layers, the child's stdin/stdout pipes are
+polled with epoll and read with `os.readv` into one reusable buffer, sized to
+the pipe's capacity, so a full pipe is drained in a single system call and
+handed to the msgpack unpacker without copying it into a new bytes object.
+"""
+import fcntl
+import os
+import signal
+import subprocess
+from collections import deque
+
+from ActualVim.lib.asyncio_inc import selectors
+
+from .base import BaseEventLoop
+
+
+# from <linux/fcntl.h>, the fcntl module doesn't export it before 3.10
+F_GETPIPE_SZ = 1032
+DEFAULT_READ_SIZE = 65536
+
+
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def _pipe_size(fd):
+    try:
+        return fcntl.fcntl(fd, F_GETPIPE_SZ)
+    except OSError:
+        return DEFAULT_READ_SIZE
+
+
+class PipeEventLoop(BaseEventLoop):
+
+    """`BaseEventLoop` subclass that uses epoll on the child's pipes."""
+
+    def _init(self):
+        self._selector = selectors.EpollSelector()
+        self._callbacks = deque()
+        self._outbuf = bytearray()
+        self._writing = False
+        self._running = False
+        self._closed = False
+        self._proc = None
+        self._signals = {}
+
+        # self-pipe so other threads can wake up the loop
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        _set_nonblocking(self._wakeup_r)
+        _set_nonblocking(self._wakeup_w)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ,
+                                self._on_wakeup)
+
+    def _connect_child(self, argv):
+        self._proc = subprocess.Popen(argv, bufsize=0,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL)
+        self._read_fd = self._proc.stdout.fileno()
+        self._write_fd = self._proc.stdin.fileno()
+        _set_nonblocking(self._read_fd)
+        _set_nonblocking(self._write_fd)
+
+        self._buf = bytearray(_pipe_size(self._read_fd))
+        self._view = memoryview(self._buf)
+        self._queued_data = deque()
+
+    def _start_reading(self):
+        self._selector.register(self._read_fd, selectors.EVENT_READ,
+                                self._on_readable)
+
+    def _on_readable(self):
+        try:
+            n = os.readv(self._read_fd, [self._buf])
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._on_error(e.strerror)
+            return
+        if not n:
+            self._selector.unregister(self._read_fd)
+            self._proc.poll()
+            self._on_error('EOF')
+            return
+        # the unpacker copies what it needs, so the buffer can be reused
+        if self._on_data:
+            self._on_data(self._view[:n])
+        else:
+            self._queued_data.append(bytes(self._view[:n]))
+
+    def _send(self, data):
+        if self._outbuf:
+            self._outbuf.extend(data)
+            return
+        try:
+            n = os.write(self._write_fd, data)
+        except (BlockingIOError, InterruptedError):
+            n = 0
+        except OSError as e:
+            self._on_error(e.strerror)
+            return
+        if n < len(data):
+            self._outbuf.extend(memoryview(data)[n:])
+            self._selector.register(self._write_fd, selectors.EVENT_WRITE,
+                                    self._on_writable)
+
+    def _on_writable(self):
+        try:
+            n = os.write(self._write_fd, self._outbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._selector.unregister(self._write_fd)
+            self._on_error(e.strerror)
+            return
+        del self._outbuf[:n]
+        if not self._outbuf:
+            self._selector.unregister(self._write_fd)
+
+    def _run(self):
+        # set first, so a stop() while draining queued data isn't overwritten
+        self._running = True
+        while self._queued_data and self._running:
+            self._on_data(self._queued_data.popleft())
+        while self._running:
+            for key, mask in self._selector.select():
+                key.data()
+                if not self._running:
+                    break
+        if self._error and not isinstance(self._error, KeyboardInterrupt):
+            # EOF or a pipe error, run() refuses to start again after this
+            self._close()
+
+    def _close(self):
+        self._closed = True
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+        self._proc.stdin.close()
+        self._proc.stdout.close()
+
+    def _stop(self):
+        self._running = False
+
+    def _threadsafe_call(self, fn):
+        if self._closed:
+            return
+        self._callbacks.append(fn)
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except BlockingIOError:
+            # the pipe is full, so a wakeup is already pending
+            pass
+
+    def _on_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        callbacks = self._callbacks
+        while callbacks:
+            callbacks.popleft()()
+
+    def _setup_signals(self, signals):
+        def handler(signum, frame):
+            self._threadsafe_call(lambda: self._on_signal(signum))
+
+        for signum in signals:
+            self._signals[signum] = signal.signal(signum, handler)
+
+    def _teardown_signals(self):
+        for signum, old in self._signals.items():
+            signal.signal(signum, old)
+        self._signals = {}
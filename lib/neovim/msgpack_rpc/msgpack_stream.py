@@ -24,8 +24,10 @@ class MsgpackStream(object):
         self._event_loop.threadsafe_call(fn)
 
     def send(self, msg):
-        """Queue `msg` for sending to Nvim."""
-        self._event_loop.send(msgpack.packb(msg))
+        """Queue `msg` for sending to Nvim and return its packed size."""
+        data = msgpack.packb(msg)
+        self._event_loop.send(data)
+        return len(data)
 
     def run(self, message_cb):
         """Run the event loop to receive messages from Nvim.
@@ -0,0 +1,133 @@
+"""Opt-in accounting for the msgpack-rpc pipeline."""
+import threading
+import time
+
+from ActualVim.lib import msgpack
+
+
+def _name(method):
+    if isinstance(method, bytes):
+        return method.decode('utf-8', 'replace')
+    return method
+
+
+class RpcProfiler(object):
+
+    """Per-method call counts, byte sizes and round-trip latency.
+
+    Install it with `AsyncSession.set_profiler()`. Outgoing requests and
+    notifications are recorded with their packed size, responses are matched
+    to their request to measure round-trip latency, and incoming
+    notifications are counted by method, with `redraw` batches further
+    broken down by sub-event.
+
+    Incoming sizes are measured by re-packing the decoded message, so the
+    profiler has a cost of its own and should only be installed on demand.
+    """
+
+    def __init__(self):
+        """Create an empty profiler."""
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.reset()
+
+    def reset(self):
+        """Drop all collected counters (in-flight requests are kept)."""
+        with self._lock:
+            self._started = time.time()
+            self._methods = {}
+            self._notifications = {}
+            self._redraw = {}
+
+    def _method(self, method):
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods[method] = {
+                'calls': 0,
+                'notifies': 0,
+                'request_bytes': 0,
+                'response_bytes': 0,
+                'responses': 0,
+                'latency_total': 0.0,
+                'latency_max': 0.0,
+            }
+        return stats
+
+    def on_request(self, request_id, method, size):
+        """Record an outgoing request of `size` bytes."""
+        method = _name(method)
+        with self._lock:
+            stats = self._method(method)
+            stats['calls'] += 1
+            stats['request_bytes'] += size
+            self._pending[request_id] = (method, time.time())
+
+    def on_notify(self, method, size):
+        """Record an outgoing notification(async request) of `size` bytes."""
+        with self._lock:
+            stats = self._method(_name(method))
+            stats['notifies'] += 1
+            stats['request_bytes'] += size
+
+    def on_message(self, msg):
+        """Record an incoming message."""
+        size = len(msgpack.packb(msg))
+        with self._lock:
+            if msg[0] == 1:
+                pending = self._pending.pop(msg[1], None)
+                if pending is None:
+                    return
+                method, start = pending
+                latency = time.time() - start
+                stats = self._method(method)
+                stats['responses'] += 1
+                stats['response_bytes'] += size
+                stats['latency_total'] += latency
+                stats['latency_max'] = max(stats['latency_max'], latency)
+            elif msg[0] == 2:
+                method = _name(msg[1])
+                stats = self._notifications.setdefault(method, {'count': 0, 'bytes': 0})
+                stats['count'] += 1
+                stats['bytes'] += size
+                if method == 'redraw':
+                    for cmd in msg[2]:
+                        name = _name(cmd[0])
+                        stats = self._redraw.setdefault(name, {'batches': 0, 'calls': 0})
+                        stats['batches'] += 1
+                        stats['calls'] += len(cmd) - 1
+
+    def snapshot(self):
+        """Return a copy of the counters as plain dicts.
+
+        Latencies are reported in milliseconds.
+        """
+        with self._lock:
+            methods = {}
+            for method, stats in self._methods.items():
+                stats = dict(stats)
+                total = stats.pop('latency_total')
+                stats['latency_avg'] = total / stats['responses'] * 1000 if stats['responses'] else 0.0
+                stats['latency_max'] *= 1000
+                methods[method] = stats
+            return {
+                'elapsed': time.time() - self._started,
+                'methods': methods,
+                'notifications': {k: dict(v) for k, v in self._notifications.items()},
+                'redraw': {k: dict(v) for k, v in self._redraw.items()},
+            }
+
+    def report(self):
+        """Format `snapshot()` as a human readable table."""
+        snap = self.snapshot()
+        lines = ['rpc profile over {:.1f}s'.format(snap['elapsed'])]
+        lines.append('{:<32} {:>7} {:>7} {:>10} {:>10} {:>9} {:>9}'.format(
+            'method', 'calls', 'async', 'sent', 'received', 'avg ms', 'max ms'))
+        methods = sorted(snap['methods'].items(), key=lambda i: -(i[1]['calls'] + i[1]['notifies']))
+        for method, s in methods:
+            lines.append('{:<32} {calls:>7} {notifies:>7} {request_bytes:>10} {response_bytes:>10} '
+                         '{latency_avg:>9.2f} {latency_max:>9.2f}'.format(method, **s))
+        for method, s in sorted(snap['notifications'].items()):
+            lines.append('notification {:<19} {count:>7} {bytes:>10} bytes'.format(method, **s))
+        for name, s in sorted(snap['redraw'].items(), key=lambda i: -i[1]['calls']):
+            lines.append('  redraw {:<23} {batches:>7} batches {calls:>9} calls'.format(name, **s))
+        return '\n'.join(lines)
@@ -1,6 +1,7 @@
 """Synchronous msgpack-rpc session layer."""
 import threading
 from collections import deque
+from concurrent.futures import Future, TimeoutError
 from queue import Queue
 
 from traceback import format_exc
@@ -16,11 +17,18 @@ def spawn_thread(fn):
 
 class Session(object):
 
-    """Msgpack-rpc session layer that uses coroutines for a synchronous API.
+    """Msgpack-rpc session layer that exposes a synchronous API.
 
-    This class provides the public msgpack-rpc API required by this library.
-    It uses the greenlet module to handle requests and notifications coming
-    from Nvim with a synchronous API.
+    Once `run()` is called, the thread running it becomes the only thread
+    that touches the transport. Other threads submit work to it through a
+    deque and get a `Future` back for requests, so blocking calls never
+    contend on a lock with the event loop. Notifications and request
+    callbacks are delivered in order by a single handler thread, while
+    requests from Nvim get a thread each since their handlers may block on
+    further requests.
+
+    Before `run()` is called, requests run the event loop inline on the
+    calling thread.
     """
 
     def __init__(self, async_session):
@@ -30,8 +38,18 @@ class Session(object):
         self._pending_messages = deque()
         self._is_running = False
         self._setup_exception = None
+        # only used by the inline event loop before `run()`
         self._lock = threading.RLock()
 
+        # work for the I/O thread, see `_submit()`
+        self._submitted = deque()
+        self._wakeup = False
+        self._futures = set()
+        self._handler_queue = None
+
+        # seconds a blocking request waits for its response, None waits forever
+        self.request_timeout = None
+
     def threadsafe_call(self, fn, *args, **kwargs):
         """Wrapper around `AsyncSession.threadsafe_call`."""
         def handler():
@@ -45,6 +63,10 @@ class Session(object):
 
         self._async_session.threadsafe_call(greenlet_wrapper)
 
+    def set_profiler(self, profiler):
+        """Wrapper around `AsyncSession.set_profiler`."""
+        self._async_session.set_profiler(profiler)
+
     def next_message(self):
         """Block until a message(request or notification) is available.
 
@@ -63,10 +85,9 @@ class Session(object):
     def request(self, method, *args, **kwargs):
         """Send a msgpack-rpc request and block until as response is received.
 
-        If the event loop is running, this method must have been called by a
-        request or notification handler running on a greenlet. In that case,
-        send the quest and yield to the parent greenlet until a response is
-        available.
+        While the event loop is running, the request is handed to the I/O
+        thread and this waits on its `Future`, for up to `request_timeout`
+        seconds.
 
         When the event loop is not running, it will perform a blocking request
         like this:
@@ -77,31 +98,112 @@ class Session(object):
         If the `async` flag is present and True, a asynchronous notification is
         sent instead. This will never block, and the return value or error is
         ignored.
+
+        If a `cb` is passed, this doesn't block and `cb(err, rv)` is called
+        from the handler thread once the response arrives.
+        """
+        async = kwargs.pop('async', False)
+        cb = kwargs.pop('cb', None)
+        if kwargs:
+            raise ValueError("request got unsupported keyword argument(s): {}"
+                             .format(', '.join(kwargs.keys())))
+
+        if not self._is_running:
+            return self._inline_request(method, args, async, cb)
+
+        if async:
+            self._submit(lambda: self._async_session.notify(method, args))
+            return
+
+        future = self.request_future(method, *args)
+        if cb:
+            def done(future):
+                v = future.result()
+                if v:
+                    self._dispatch(cb, *v)
+            future.add_done_callback(done)
+            return
+
+        try:
+            v = future.result(timeout=self.request_timeout)
+        except TimeoutError:
+            raise IOError('request "{}" timed out'.format(method))
+        if not v:
+            # EOF
+            raise IOError('EOF')
+        err, rv = v
+        if err:
+            raise self.error_wrapper(err)
+        return rv
+
+    def request_future(self, method, *args):
+        """Send a msgpack-rpc request from any thread without blocking.
+
+        Returns a `concurrent.futures.Future` resolving to `(err, rv)`, or to
+        None if the connection is closed first. This requires the event loop
+        to be running.
         """
+        future = Future()
+
+        def send():
+            def response_cb(err, rv):
+                self._futures.discard(future)
+                future.set_result((err, rv))
+
+            self._futures.add(future)
+            self._async_session.request(method, args, response_cb)
+
+        self._submit(send)
+        return future
+
+    def _submit(self, fn):
+        # deque.append is atomic, so producers never take a lock; the I/O
+        # thread is only woken up if it hasn't been asked to drain already
+        self._submitted.append(fn)
+        if not self._wakeup:
+            self._wakeup = True
+            self._async_session.threadsafe_call(self._drain)
+
+    def _drain(self):
+        # clear the flag first, anything appended after this schedules a new drain
+        self._wakeup = False
+        submitted = self._submitted
+        while submitted:
+            fn = submitted.popleft()
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+
+    def _dispatch(self, fn, *args):
+        # run `fn` on the serial handler thread
+        self._handler_queue.put((fn, args))
+
+    def _handler_loop(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            fn, args = item
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+
+    def _inline_request(self, method, args, async, cb):
         with self._lock:
-            async = kwargs.pop('async', False)
             if async:
                 self._async_session.notify(method, args)
                 return
 
-            cb = kwargs.pop('cb', None)
             if cb:
                 def indirect(*args, **kwargs):
                     self.threadsafe_call(cb, *args, **kwargs)
                 self._async_session.request(method, args, indirect)
-                if not self._is_running:
-                    self._async_session.run(self._enqueue_request, self._enqueue_notification)
+                self._async_session.run(self._enqueue_request, self._enqueue_notification)
                 return
 
-            if kwargs:
-                raise ValueError("request got unsupported keyword argument(s): {}"
-                                 .format(', '.join(kwargs.keys())))
-
-            if self._is_running:
-                v = self._yielding_request(method, args)
-            else:
-                v = self._blocking_request(method, args)
-
+            v = self._blocking_request(method, args)
             if not v:
                 # EOF
                 raise IOError('EOF')
@@ -113,13 +215,18 @@ class Session(object):
     def run(self, request_cb, notification_cb, setup_cb=None):
         """Run the event loop to receive requests and notifications from Nvim.
 
-        Like `AsyncSession.run()`, but `request_cb` and `notification_cb` are
-        inside greenlets.
+        Like `AsyncSession.run()`, but `notification_cb` is called in order
+        from a dedicated handler thread, and `request_cb` on its own thread.
+        The calling thread becomes the I/O thread until the loop stops.
         """
         self._request_cb = request_cb
         self._notification_cb = notification_cb
-        self._is_running = True
         self._setup_exception = None
+        self._handler_queue = q = Queue()
+        t = threading.Thread(target=self._handler_loop, args=(q,))
+        t.daemon = True
+        t.start()
+        self._is_running = True
 
         def on_setup():
             try:
@@ -143,23 +250,22 @@ class Session(object):
         self._is_running = False
         self._request_cb = None
         self._notification_cb = None
+        q.put(None)
+
+        # nothing will answer requests that are still in flight
+        for future in list(self._futures):
+            future.set_result(None)
+        self._futures.clear()
 
         if self._setup_exception:
             raise self._setup_exception
 
     def stop(self):
         """Stop the event loop."""
-        self._async_session.stop()
-
-    def _yielding_request(self, method, args):
-        q = Queue()
-
-        def response_cb(err, rv):
-            q.put((err, rv))
-
-        self._async_session.request(method, args, response_cb)
-        # FIXME timeout is to avoid hang
-        return q.get(timeout=1)
+        if self._is_running:
+            self._submit(self._async_session.stop)
+        else:
+            self._async_session.stop()
 
     def _blocking_request(self, method, args):
         result = []
@@ -191,11 +297,14 @@ class Session(object):
         def handler():
             try:
                 rv = self._request_cb(name, args)
-                response.send(rv)
+                self._submit(lambda: response.send(rv))
             except ErrorResponse as err:
-                response.send(err.args[0], error=True)
+                # `err` is unbound once the except block ends, before the I/O thread sends this
+                msg = err.args[0]
+                self._submit(lambda: response.send(msg, error=True))
             except Exception as err:
-                response.send(repr(err) + "\n" + format_exc(5), error=True)
+                msg = repr(err) + "\n" + format_exc(5)
+                self._submit(lambda: response.send(msg, error=True))
 
         # Create a new greenlet to handle the request
         spawn_thread(handler)
@@ -207,7 +316,7 @@ class Session(object):
             except Exception:
                 pass
 
-        spawn_thread(handler)
+        self._dispatch(handler)
 
 
 class ErrorResponse(BaseException):
@@ -2,6 +2,7 @@ import contextlib
 import os
 import queue
 import sublime
+import subprocess
 import sys
 import threading
 import time
@@ -10,12 +11,17 @@ import traceback
 from .lib import neovim
 from .lib import util
 from . import settings
+from .latency import tracer
+from .recorder import Recorder
 from .screen import Screen
 
 if not '_loaded' in globals():
     NEOVIM_PATH = None
     _loaded = False
     _loading = False
+    # nvim pool (neovim_instances), started on demand; instances[0] is always `vim`
+    instances = []
+    _instances_lock = threading.Lock()
 
 INSERT_MODES = ['i', 'R']
 VISUAL_MODES = ['V', 'v', '\x16']
@@ -39,6 +45,191 @@ MODES = {
     # TODO: select, vreplace?
 }
 
+# everything status() returns, as (key, vimscript expression), evaluated in one call by ActualVimStatus()
+STATUS_ITEMS = (
+    ('mode', 'mode()'),
+    ('modified', '&modified'),
+    ('expandtab', '&expandtab'),
+    ('ts', '&ts'),
+
+    ('cline', 'line(".") - 1'),
+    ('ccol', 'col(".") - 1'),
+    ('vline', 'line("v") - 1'),
+    ('vcol', 'col("v") - 1'),
+
+    ('wview', 'winsaveview()'),
+    ('wwidth', 'winwidth(winnr())'),
+    ('wheight', 'winheight(winnr())'),
+
+    ('screenrow', 'screenrow()'),
+    ('screencol', 'screencol()'),
+    ('botline', 'line("w$")'),
+
+    ('tick', 'b:changedtick'),
+    ('hlsearch', '&hlsearch && v:hlsearch ? @/ : ""'),
+    ('matches', 'getmatches()'),
+)
+
+# ActualVimSelect(a, b, mode) sets the cursor (b empty) or a visual selection from a to b ([line, col], 1-based)
+# and returns the resulting status, so a selection change is a single request
+SELECT_VIM = r'''
+function! ActualVimStatus()
+    return [%s]
+endfunction
+
+function! ActualVimSelect(a, b, mode)
+    if mode() =~# "^[vV\<c-v>]"
+        execute "normal! \<esc>"
+    endif
+    if empty(a:b)
+        call cursor(a:a[0], a:a[1])
+    else
+        call setpos('.', [0, a:a[0], a:a[1], 0])
+        execute 'normal! ' . a:mode
+        call setpos('.', [0, a:b[0], a:b[1], 0])
+    endif
+    return ActualVimStatus()
+endfunction
+''' % ', '.join(expr for _, expr in STATUS_ITEMS)
+
+# maps each screen row of the current window to [buffer line, first display column] (0-based),
+# [-1, -1] for diff filler and closed folds, following wrapping and folds the way nvim draws them
+ROWMAP_VIM = r'''
+function! ActualVimRowMap()
+    let info = getwininfo(win_getid())[0]
+    let textoff = get(info, 'textoff', 0)
+    let width = max([1, info.width - textoff])
+    let view = winsaveview()
+    let rows = repeat([[-1, -1]], view.topfill)
+    let lnum = line('w0')
+    let last = line('w$')
+    let skip = view.skipcol
+    while lnum <= last && len(rows) < info.height
+        let fold = foldclosedend(lnum)
+        if fold != -1
+            call add(rows, [-1, -1])
+            let lnum = fold + 1
+            continue
+        endif
+        if &wrap
+            let n = max([1, (strdisplaywidth(getline(lnum)) + width - 1) / width])
+            for i in range(skip / width, n - 1)
+                call add(rows, [lnum - 1, i * width])
+            endfor
+        else
+            call add(rows, [lnum - 1, view.leftcol])
+        endif
+        let skip = 0
+        let lnum += 1
+    endwhile
+    return {'rows': rows[:info.height - 1], 'textoff': textoff}
+endfunction
+'''
+
+# exports search and :match highlights as buffer-space [line, col, end line, end col] spans
+# (0-based byte columns, end col is the start of the last matched char or -1 for end of line)
+MATCHES_VIM = r'''
+function! ActualVimSearch(pat, max)
+    let save = winsaveview()
+    let spans = []
+    call cursor(1, 1)
+    let flags = 'cW'
+    while len(spans) < a:max
+        let start = searchpos(a:pat, flags)
+        if start[0] == 0
+            break
+        endif
+        let end = searchpos(a:pat, 'cenW')
+        call add(spans, [start[0] - 1, start[1] - 1, end[0] - 1, end[1] - 1])
+        let flags = 'W'
+    endwhile
+    call winrestview(save)
+    return spans
+endfunction
+
+function! ActualVimMatches(max)
+    let res = {'search': [], 'matches': {}}
+    if &hlsearch && v:hlsearch && @/ != ''
+        let res.search = ActualVimSearch(@/, a:max)
+    endif
+    for m in getmatches()
+        let spans = []
+        if has_key(m, 'pattern')
+            let spans = ActualVimSearch(m.pattern, a:max)
+        else
+            for k in keys(m)
+                if k !~# '^pos\d'
+                    continue
+                endif
+                let p = type(m[k]) == type([]) ? m[k] : [m[k]]
+                if len(p) == 1
+                    call add(spans, [p[0] - 1, 0, p[0] - 1, -1])
+                else
+                    call add(spans, [p[0] - 1, p[1] - 1, p[0] - 1, p[1] + get(p, 2, 1) - 2])
+                endif
+            endfor
+        endif
+        let res.matches[m.group] = get(res.matches, m.group, []) + spans
+    endfor
+    return res
+endfunction
+'''
+
+# lists named buffers on a shared server as [bufnr, full path, changedtick, b:actualvim_state]
+BUFFERS_VIM = r'''
+function! ActualVimBuffers()
+    let res = []
+    for b in range(1, bufnr('$'))
+        if bufexists(b) && bufname(b) != ''
+            call add(res, [b, fnamemodify(bufname(b), ':p'), getbufvar(b, 'changedtick'), getbufvar(b, 'actualvim_state', {})])
+        endif
+    endfor
+    return res
+endfunction
+'''
+
+# persistent undo: write/read undo files and lowercase marks for a buffer
+UNDO_VIM = r'''
+function! ActualVimWundo(buf, file)
+    let cur = bufnr('%')
+    if a:buf != cur
+        execute 'noautocmd silent keepalt buffer! ' . a:buf
+    endif
+    execute 'silent wundo! ' . fnameescape(a:file)
+    let marks = {}
+    for m in split('abcdefghijklmnopqrstuvwxyz', '\zs')
+        let p = getpos("'" . m)
+        if p[1] > 0
+            let marks[m] = [p[1], p[2]]
+        endif
+    endfor
+    if a:buf != cur
+        execute 'noautocmd silent keepalt buffer! ' . cur
+    endif
+    return marks
+endfunction
+
+function! ActualVimRundo(file, marks)
+    " refuses (silently) if the buffer text doesn't match the undo file
+    execute 'silent! rundo ' . fnameescape(a:file)
+    for [m, p] in items(a:marks)
+        call setpos("'" . m, [0, p[0], p[1], 0])
+    endfor
+endfunction
+
+function! ActualVimEdit()
+    " read the named file, skipping our BufReadCmd
+    noautocmd silent edit!
+    " sublime splits a trailing newline into an extra empty line
+    if &eol && getfsize(expand('%:p')) > 0
+        call append('$', '')
+    endif
+    setlocal nomodified
+    " checksum of the text as sublime would see it
+    return sha256(join(getline(1, '$'), "\n"))
+endfunction
+'''
+
 def plugin_loaded():
     global NEOVIM_PATH
     settings.load()
@@ -78,6 +269,7 @@ def plugin_loaded():
         vim = Vim()
         _loading = True
         vim._setup()
+        instances[:] = [vim]
 
         _loaded = True
         _loading = False
@@ -98,10 +290,39 @@ def plugin_unloaded():
 
     global vim, _loaded
     if _loaded:
-        vim.nv.command('qa!', async=True)
+        if vim.shared:
+            # leave a shared server (and its buffers) running for the next session
+            vim.detach()
+        else:
+            for inst in instances:
+                inst.nv.command('qa!', async=True)
+        instances[:] = []
         vim = None
         _loaded = False
 
+def instance_for(view):
+    # the nvim instance a view's buffer lives in
+    # with neovim_instances > 1, views are spread over a pool by window or view id (instance_assign)
+    count = settings.get('neovim_instances', 1)
+    if count <= 1 or vim.shared:
+        return vim
+    window = view.window()
+    if settings.get('instance_assign') == 'window' and window:
+        n = window.id()
+    else:
+        n = view.id()
+    i = n % count
+    with _instances_lock:
+        while len(instances) <= i:
+            inst = Vim()
+            inst._setup()
+            instances.append(inst)
+    return instances[i]
+
+def active_instance():
+    view = sublime.active_window().active_view()
+    return instance_for(view) if view else vim
+
 
 class Vim:
     def __init__(self, nv=None):
@@ -116,6 +337,22 @@ class Vim:
         self.width = 80
         self.height = 24
 
+        # msgpack-rpc accounting, see rpc_profile()
+        self.profiler = None
+        # redraw stream recorder, see record()
+        self.recorder = None
+
+        # pending ui size, coalesced from every view until the layout settles
+        self.resize_pending = None
+        self.resize_gen = 0
+
+        # connected to a long-lived server (neovim_listen) instead of an embedded child
+        self.shared = False
+        # buffers a previous session left on the shared server, by path
+        self.orphans = {}
+        # buffer number -> tabpage, with view_tabpages
+        self.tabpages = {}
+
     def _setup(self):
         self.screen = Screen()
         self.views = {}
@@ -124,11 +361,21 @@ class Vim:
         if not isinstance(args, list):
             print('ActualVim: ignoring non-list ({}) args: {}'.format(type(args), repr(args)))
             args = []
-        self.nv = neovim.attach('child', argv=[NEOVIM_PATH, '--embed', '-n'] + args)
+        listen = settings.get('neovim_listen')
+        if listen:
+            self.shared = True
+            self.nv, spawned = self._attach_server(listen, args)
+        else:
+            self.nv = neovim.attach('child', argv=[NEOVIM_PATH, '--embed', '-n'] + args)
+            spawned = True
+        self.nv._session.request_timeout = settings.get('rpc_timeout', 5)
+        if settings.get('rpc_profile'):
+            self.rpc_profile()
 
         # toss in <FocusGained> in case there's a blocking prompt on startup (like vimrc errors)
         self.nv.input('<FocusGained>')
-        messages = self.nv.eval('execute("messages")').strip()
+        # a server we reconnected to would repeat the last session's messages
+        messages = spawned and self.nv.eval('execute("messages")').strip()
         if messages:
             print('ActualVim: nvim startup error:')
             print('-'*20)
@@ -149,9 +396,14 @@ class Vim:
 
         # hidden buffers allow us to multiplex them
         self.nv.options['hidden'] = True
+        if settings.get('view_tabpages'):
+            # a tabline would take a row from the grid
+            self.nv.options['showtabline'] = 0
 
         # set up buffer read/write commands
-        cmd = 'autocmd {{}} * :call rpcrequest({}, "{{}}", expand("<abuf>"), expand("<afile>"))'.format(self.nv.channel_id)
+        # (in a group cleared first, so a shared server drops the previous session's channel)
+        self.cmd('augroup ActualVim | autocmd! | augroup END')
+        cmd = 'autocmd ActualVim {{}} * :call rpcrequest({}, "{{}}", expand("<abuf>"), expand("<afile>"))'.format(self.nv.channel_id)
         # self.cmd(cmd.format('BufWritePre', 'write_pre'))
         self.cmd(cmd.format('BufReadCmd', 'read'))
         self.cmd(cmd.format('BufWriteCmd', 'write'))
@@ -162,6 +414,22 @@ class Vim:
         complete = r'''return rpcrequest({}, \"complete\", bufnr(\"%\"), a:findstart, a:base)'''.format(self.nv.channel_id)
         self.eval(r'''execute(":function! ActualVimComplete(findstart, base) \n {} \n endfunction")'''.format(complete))
 
+        # buffer-space highlight export (highlight_source: buffer)
+        self.source(MATCHES_VIM)
+        self.source(UNDO_VIM)
+        self.source(SELECT_VIM)
+        self.source(ROWMAP_VIM)
+
+        if self.shared:
+            self.source(BUFFERS_VIM)
+            for number, path, tick, state in self.call('ActualVimBuffers'):
+                self.orphans[os.path.normcase(path)] = (number, tick, state)
+
+        # extmark namespace for extra cursors, needs the nvim 0.5 extmark api (api level 7)
+        self.cursor_ns = None
+        if self.nv.metadata.get('version', {}).get('api_level', 0) >= 7:
+            self.cursor_ns = self.nv.request('nvim_create_namespace', 'actualvim_cursors')
+
         self.nvim_mode = False
         try:
             res = self.nv.request('nvim_get_mode')
@@ -170,6 +438,46 @@ class Vim:
         except neovim.api.NvimError:
             pass
 
+    def _attach_server(self, addr, args):
+        # connect to a long-lived nvim listening on addr (socket path or host:port),
+        # starting one in the background if nothing is listening yet
+        # returns (nvim, spawned)
+        try:
+            return self._attach_addr(addr), False
+        except (IOError, OSError):
+            pass
+
+        env = dict(os.environ, NVIM_LISTEN_ADDRESS=addr)
+        kwargs = {}
+        if sys.platform == 'win32':
+            # DETACHED_PROCESS, so the server outlives Sublime
+            kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP | 0x8
+        else:
+            kwargs['start_new_session'] = True
+        devnull = subprocess.DEVNULL
+        subprocess.Popen([NEOVIM_PATH, '--headless', '-n'] + args, env=env,
+                         stdin=devnull, stdout=devnull, stderr=devnull, **kwargs)
+        deadline = time.time() + settings.get('rpc_timeout', 5)
+        while True:
+            try:
+                return self._attach_addr(addr), True
+            except (IOError, OSError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _attach_addr(self, addr):
+        host, sep, port = addr.rpartition(':')
+        if sep and port.isdigit():
+            return neovim.attach('tcp', address=host, port=int(port))
+        return neovim.attach('socket', path=os.path.expanduser(addr))
+
+    def detach(self):
+        # drop our autocmds and UI, but leave the server and its buffers alone
+        self.nv.command('autocmd! ActualVim', async=True)
+        self.nv.request('nvim_ui_detach', async=True)
+        self.nv.stop_loop()
+
     def _event_loop(self):
         def on_notification(method, data):
             # if vim exits, we might get a notification on the way out
@@ -177,6 +485,9 @@ class Vim:
                 return
 
             if method == 'redraw':
+                rec = self.recorder
+                if rec:
+                    rec.write(method, data)
                 for cmd in data:
                     name, args = cmd[0], cmd[1:]
                     # TODO: allow subscribing to these
@@ -184,9 +495,9 @@ class Vim:
                         self.av.on_bell()
                     elif name in ('popupmenu_show', 'popupmenu_hide', 'popupmenu_select'):
                         self.av.on_popupmenu(name, args)
-                vim.screen.redraw(data)
+                self.screen.redraw(data)
                 if self.av:
-                    self.av.on_redraw(data, vim.screen)
+                    self.av.on_redraw(data, self.screen)
 
         def on_request(method, args):
             # TODO: what if I need to handle requests that don't start with bufid?
@@ -214,9 +525,35 @@ class Vim:
 
         self.nv.run_loop(on_request, on_notification, on_setup)
 
+    # rpc accounting
+    def rpc_profile(self, enable=True):
+        # stopping keeps the collected counters around for rpc_snapshot()
+        if enable and not self.profiler:
+            self.profiler = neovim.msgpack_rpc.RpcProfiler()
+        self.nv._session.set_profiler(self.profiler if enable else None)
+
+    def rpc_snapshot(self):
+        if self.profiler:
+            return self.profiler.snapshot()
+
+    def record(self, path=None):
+        # start recording redraw batches to path, or stop with path=None
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        if path:
+            self.recorder = Recorder(path, self.screen.w, self.screen.h)
+
     def cmd(self, *args, **kwargs):
         return self.nv.command_output(*args, **kwargs)
 
+    def call(self, name, *args):
+        return self.nv.call(name, *args)
+
+    def source(self, script):
+        # execute() runs a list of lines like a sourced file, so functions can span lines
+        return self.nv.call('execute', script.strip().split('\n'))
+
     def eval(self, *cmds):
         if len(cmds) == 1:
             return self.nv.eval(cmds[0])
@@ -226,24 +563,88 @@ class Vim:
     def activate(self, av):
         if self.av != av:
             self.av = av
-            self.cmd('b! {:d}'.format(av.buf.number))
+            tab = self.tabpages.get(av.buf.number)
+            if tab is not None:
+                # the view's own tabpage keeps its cursor and scroll, so nothing is reloaded
+                self.nv.current.tabpage = tab
+            else:
+                self.cmd('b! {:d}'.format(av.buf.number))
             return True
         return False
 
+    def _open(self, cmd, tabcmd):
+        # open a buffer in the current window, or in a tabpage of its own with view_tabpages
+        if settings.get('view_tabpages'):
+            self.cmd(tabcmd)
+            return self.nv.current.tabpage
+        self.cmd(cmd)
+
     # buffer methods
     def buf_new(self, view):
-        self.cmd('enew')
+        tab = self._open('enew', 'tabnew')
         buf = max((b.number, b) for b in self.nv.buffers)[1]
+        if tab is not None:
+            self.tabpages[buf.number] = tab
         buf.options['buftype'] = 'acwrite'
         for k, v in settings.get('bufopts').items():
             buf.options[k] = v
         self.views[buf.number] = view
         return buf
 
+    def buf_adopt(self, view, path, digest):
+        # take over a buffer a previous session left on the shared server for path
+        # returns (buf, in_sync): in_sync means it's unchanged since it was last seen
+        # matching a view with this content digest, so the text needn't be sent again
+        entry = self.orphans.pop(os.path.normcase(os.path.abspath(path)), None)
+        if not entry:
+            return None, False
+        number, tick, state = entry
+        try:
+            buf = self.nv.buffers[number]
+        except KeyError:
+            return None, False
+        tab = self._open('b! {:d}'.format(number), 'tab sbuffer {:d}'.format(number))
+        if tab is not None:
+            self.tabpages[number] = tab
+        self.views[number] = view
+        in_sync = state.get('tick') == tick and state.get('hash') == digest
+        return buf, in_sync
+
+    def buf_edit(self, buf, path):
+        # load path from disk into the current (new) buffer instead of sending the text over rpc
+        # returns the sha256 of the text nvim read, to compare against the view
+        buf.name = path
+        try:
+            return self.call('ActualVimEdit')
+        except neovim.api.NvimError:
+            return None
+
+    def buf_wundo(self, buf, undofile):
+        # returns the buffer's lowercase marks as {name: [line, col]}
+        return self.call('ActualVimWundo', buf.number, undofile)
+
+    def buf_rundo(self, undofile, marks):
+        # current buffer only
+        self.call('ActualVimRundo', undofile, marks)
+
     def buf_close(self, buf):
         self.views.pop(buf.number, None)
+        # wiping the buffer closes its tabpage too
+        self.tabpages.pop(buf.number, None)
         self.cmd('bw! {:d}'.format(buf.number))
 
+    def cursors_set(self, buf, points):
+        # replace the extra cursor extmarks with points [(line, col), ...] (0-based, byte cols),
+        # an (anchor, cursor) pair per selection, in a single atomic request
+        calls = [['nvim_buf_clear_namespace', [buf, self.cursor_ns, 0, -1]]]
+        for i, (line, col) in enumerate(points):
+            calls.append(['nvim_buf_set_extmark', [buf, self.cursor_ns, line, col, {'id': i + 1}]])
+        self.nv.request('nvim_call_atomic', calls)
+
+    def cursors_get(self, buf):
+        marks = self.nv.request('nvim_buf_get_extmarks', buf, self.cursor_ns, 0, -1, {})
+        return [(line, col) for _, line, col in sorted(marks)]
+
     def buf_tick(self, buf):
         return int(self.eval('getbufvar({}, "changedtick")'.format(buf.number)))
 
@@ -297,6 +698,7 @@ class Vim:
         was_ready = self.ready.acquire(False)
 
         ret = self.nv.input(key)
+        tracer.mark('input')
         if key in HALF_KEYS and was_ready and mode_last == 'n':
             ready = False
         elif mode_last in INSERT_MODES and key in SIMPLE_KEYS:
@@ -308,64 +710,52 @@ class Vim:
                 ready = not res.get('blocking', True)
             else:
                 ready = self._ask_async_ready()
+        tracer.mark('ready')
         if ready:
             self.ready.release()
         return ret, ready
 
     def status(self, update=True, force=False):
-        # TODO: use nvim_atomic? we need to get sel, buf, mode, everything at once if possible
         with self.status_lock:
             if self.status_dirty and update or force:
-                items = {
-                    'mode': 'mode()',
-                    'modified': '&modified',
-                    'expandtab': '&expandtab',
-                    'ts': '&ts',
-
-                    'cline': 'line(".") - 1',
-                    'ccol': 'col(".") - 1',
-                    'vline': 'line("v") - 1',
-                    'vcol': 'col("v") - 1',
-
-                    'wview': 'winsaveview()',
-                    'wwidth': 'winwidth(winnr())',
-                    'wheight': 'winheight(winnr())',
-
-                    'screenrow': 'screenrow()',
-                    'screencol': 'screencol()',
-                }
-                expr = '[' + (', '.join(items.values())) + ']'
-                self.status_last = dict(zip(items.keys(), self.eval(expr)))
-                self.status_dirty = False
+                self._set_status(self.call('ActualVimStatus'))
             return self.status_last
 
-    def setpos(self, expr, line, col):
-        return self.eval('setpos("{}", [0, {:d}, {:d}])'.format(expr, line, col))
+    def _set_status(self, values):
+        self.status_last = dict(zip((key for key, _ in STATUS_ITEMS), values))
+        self.status_dirty = False
 
     def select(self, a, b=None, mode='v'):
-        if b is None:
-            if self.mode in VISUAL_MODES:
-                self.nv.input('<c-\\><c-n>')
-            self.status_dirty = True
-            self.eval('cursor({:d}, {:d}, {:d})'.format(a[0], a[1], a[1]))
-        else:
-            special = mode.startswith('<c-')
-            if self.mode in VISUAL_MODES:
-                self.nv.input('<c-\\><c-n>')
-            self.status_dirty = True
-
-            self.setpos('.', *a)
-            if special:
-                self.cmd('exe "normal! \\{}"'.format(mode))
-            else:
-                self.cmd('normal! {}'.format(mode))
-            self.setpos('.', *b)
+        # one request: leaves visual mode, places the cursor or selection, and refreshes status()
+        if mode == '<c-v>':
+            mode = '\x16'
+        with self.status_lock:
+            self._set_status(self.call('ActualVimSelect', list(a), list(b) if b else [], mode))
 
     def resize(self, width, height):
-        w, h = int(width), int(height)
-        if w and h and w != self.width and h != self.height and self.check_ready():
-            self.width, self.height = w, h
-            self.nv.ui_try_resize(w, h)
+        size = (int(width), int(height))
+        if not all(size):
+            return
+        if size == (self.resize_pending or (self.width, self.height)):
+            return
+        # debounce: every new size restarts the timer, so dragging a split
+        # only costs a single ui_try_resize once the layout stops changing
+        self.resize_pending = size
+        self.resize_gen += 1
+        gen = self.resize_gen
+        sublime.set_timeout(lambda: self._resize_flush(gen), settings.get('resize_delay', 100))
+
+    def _resize_flush(self, gen):
+        # a newer size was requested, its own timer will flush
+        if gen != self.resize_gen or not self.resize_pending:
+            return
+        if not self.check_ready():
+            sublime.set_timeout(lambda: self._resize_flush(gen), settings.get('resize_delay', 100))
+            return
+        size, self.resize_pending = self.resize_pending, None
+        if size != (self.width, self.height):
+            self.width, self.height = size
+            self.nv.request('nvim_ui_try_resize', *size)
 
     @property
     def mode(self):
@@ -0,0 +1,56 @@
+# records nvim redraw notifications to a file so they can be replayed through Screen offline
+# file format: a msgpack header [MAGIC, VERSION, width, height], then one [seconds, method, args] per batch
+
+import threading
+import time
+
+from .lib import msgpack
+
+MAGIC = 'actualvim-redraw'
+VERSION = 1
+
+
+class Recorder:
+    def __init__(self, path, width, height):
+        self.path = path
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.batches = 0
+        self.f = open(path, 'wb')
+        self.f.write(msgpack.packb([MAGIC, VERSION, width, height]))
+
+    def write(self, method, args):
+        data = msgpack.packb([time.time() - self.start, method, args])
+        with self.lock:
+            if self.f:
+                self.f.write(data)
+                self.batches += 1
+
+    def close(self):
+        with self.lock:
+            if self.f:
+                self.f.close()
+                self.f = None
+
+
+def read(path):
+    # returns (width, height), [(seconds, method, args), ...]
+    with open(path, 'rb') as f:
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(f.read())
+
+    def text(s):
+        return s.decode('utf-8', 'replace') if isinstance(s, bytes) else s
+
+    def decode(obj):
+        if isinstance(obj, (list, tuple)):
+            return [decode(o) for o in obj]
+        elif isinstance(obj, dict):
+            return {text(k): decode(v) for k, v in obj.items()}
+        return text(obj)
+
+    it = iter(unpacker)
+    header = decode(next(it))
+    if header[:2] != [MAGIC, VERSION]:
+        raise ValueError('{}: not an ActualVim redraw recording'.format(path))
+    return tuple(header[2:4]), [decode(batch) for batch in it]
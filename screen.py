@@ -1,7 +1,38 @@
+import threading
+from types import MappingProxyType
+
+# highlight attribute sets are interned into small ints shared by every Screen,
+# so cells hold an int instead of whatever dict highlight_set delivered, and comparing them is cheap
+# id 0 is always "no highlight"
+_hl_ids = {(): 0}
+_hl_attrs = [MappingProxyType({})]
+_hl_lock = threading.Lock()
+
+def intern(highlight):
+    key = tuple(sorted(highlight.items()))
+    hl = _hl_ids.get(key)
+    if hl is None:
+        with _hl_lock:
+            hl = _hl_ids.get(key)
+            if hl is None:
+                hl = _hl_ids[key] = len(_hl_attrs)
+                _hl_attrs.append(MappingProxyType(dict(key)))
+    return hl
+
+def attrs(hl):
+    # read-only attribute dict for an interned id
+    return _hl_attrs[hl]
+
 class Cell:
-    def __init__(self, c=' '):
+    __slots__ = ('c', 'hl')
+
+    def __init__(self, c=' ', hl=0):
         self.c = c
-        self.highlight = {}
+        self.hl = hl
+
+    @property
+    def highlight(self):
+        return _hl_attrs[self.hl]
 
     def __mul__(self, n):
         return [Cell(self.c) for i in range(n)]
@@ -10,27 +41,33 @@ class Cell:
         return self.c
 
 class Highlight:
-    def __init__(self, line, highlight):
+    __slots__ = ('line', 'hl', 'start', 'end')
+
+    def __init__(self, line, hl):
         self.line = line
-        self.highlight = highlight
+        self.hl = hl
         self.start = 0
         self.end = 0
 
+    @property
+    def highlight(self):
+        return _hl_attrs[self.hl]
+
     def s(self):
-        return (self.line, self.start, self.end, tuple(self.highlight.items()))
+        return (self.line, self.start, self.end, self.hl)
 
     def __eq__(self, h):
         return self.s() == h.s()
 
     def __hash__(self):
-        return hash((self.line, self.start, self.end, tuple(self.highlight.items())))
+        return hash(self.s())
 
 class Screen:
     def __init__(self):
         self.x = 0
         self.y = 0
         self.resize(1, 1)
-        self.highlight = {}
+        self.hl = 0
         self.changes = 0
 
     def resize(self, w, h):
@@ -46,9 +83,28 @@ class Screen:
     def scroll(self, dy):
         ya, yb = self.scroll_region[0:2]
         xa, xb = self.scroll_region[2:4]
+        if not dy:
+            return
+        if xa == 0 and xb == self.w:
+            # full width: rotate the row lists, and only clear the rows that come into view
+            rows = self.screen[ya:yb]
+            n = min(abs(dy), len(rows))
+            if dy > 0:
+                rows = rows[n:] + rows[:n]
+                fresh = rows[len(rows) - n:]
+            else:
+                rows = rows[len(rows) - n:] + rows[:len(rows) - n]
+                fresh = rows[:n]
+            self.screen[ya:yb] = rows
+            for row in fresh:
+                for cell in row:
+                    cell.c = ' '
+                    cell.hl = 0
+            return
+
         yi = (ya, yb)
         if dy < 0:
-            yi = (yb, ya - 1)
+            yi = (yb - 1, ya - 1)
 
         for y in range(yi[0], yi[1], int(dy / abs(dy))):
             if ya <= y + dy < yb:
@@ -78,15 +134,17 @@ class Screen:
                     for c in cs:
                         cell = self[self.x, self.y]
                         cell.c = c
-                        cell.highlight = self.highlight
+                        cell.hl = self.hl
                         self.x += 1
             elif name == 'resize':
                 changed = True
                 self.resize(*args[0])
             elif name == 'highlight_set':
-                self.highlight = args[0][0]
+                self.hl = intern(args[0][0])
             elif name == 'set_scroll_region':
-                self.scroll_region = args[0]
+                # nvim sends inclusive bounds
+                top, bot, left, right = args[0]
+                self.scroll_region = [top, bot + 1, left, right + 1]
             elif name == 'scroll':
                 changed = True
                 self.scroll(args[0][0])
@@ -100,13 +158,13 @@ class Screen:
     def highlights(self):
         hlset = []
         for y, line in enumerate(self.screen):
-            cur = {}
+            cur = 0
             h = None
             for x, cell in enumerate(line):
-                if h and cur and cell.highlight == cur:
+                if cur and cell.hl == cur:
                     h.end = x + 1
                 else:
-                    cur = cell.highlight
+                    cur = cell.hl
                     if cur:
                         h = Highlight(y, cur)
                         h.start = x
@@ -124,7 +182,7 @@ class Screen:
         try:
             cell = self.screen[y][x]
             cell.c = c
-            cell.highlight = self.highlight
+            cell.hl = self.hl
         except IndexError:
             pass
 
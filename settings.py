@@ -2,17 +2,36 @@ import sublime
 import sublime_plugin
 
 DEFAULT_SETTINGS = {
+    "background_sync_delay": 500,
     "bufopts": {
         "completefunc": "ActualVimComplete",
     },
+    "completion_timeout": 200,
+    "drag_interval": 16,
     "enabled": True,
+    "highlight_budget": 2000,
+    "highlight_max_matches": 1000,
+    "highlight_source": "screen",
+    "load_from_disk": True,
     "large_file_disable": {
         "bytes": 52428800,
         "lines": 50000,
     },
     "neovim_path": "",
+    "neovim_listen": "",
+    "neovim_instances": 1,
     "neovim_args": ["--cmd", "let g:actualvim = 1"],
     "indent_priority": "sublime",
+    "instance_assign": "window",
+    "popup_window": 50,
+    "resize_delay": 100,
+    "rpc_profile": False,
+    "rpc_timeout": 5,
+    "trace_latency": False,
+    "trace_window": 1000,
+    "undo_cache": True,
+    "undo_cache_entries": 500,
+    "view_tabpages": False,
     "settings": {
         "sublime": {
             "inverse_caret_state": False,
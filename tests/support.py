@@ -0,0 +1,7 @@
+# make the repo importable as the "ActualVim" package, with the sublime stand-ins from bench/
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+import package  # noqa
@@ -0,0 +1,83 @@
+import unittest
+
+import support  # noqa
+import sublime
+from ActualVim import settings
+from ActualVim.view import ActualVim
+
+
+def make_view(text):
+    av = ActualVim.__new__(ActualVim)
+    av.view = sublime.Window().new_file(text)
+    av.hl_spans = {}
+    av.hl_partial = {}
+    av.highlight = lambda: None
+    return av
+
+
+def point_regions(todo):
+    # spans are plain (a, b) points
+    return {name: [sublime.Region(a, b) for a, b in chunk] for name, chunk in todo.items()}
+
+
+class ApplyHighlightsTest(unittest.TestCase):
+    def setUp(self):
+        self.budget = settings.get('highlight_budget')
+        settings.set('highlight_budget', 3)
+
+    def tearDown(self):
+        settings.set('highlight_budget', self.budget)
+
+    def test_oversized_group_spread_over_frames(self):
+        av = make_view('x' * 100)
+        spans = {'big': tuple((i, i + 1) for i in range(8))}
+        frames = 0
+        while av.apply_highlights(spans, point_regions):
+            frames += 1
+            self.assertLessEqual(len(av.view.get_regions('big')), 3 * frames)
+        self.assertEqual(frames, 2)
+        self.assertEqual(av.view.get_regions('big'), [sublime.Region(i, i + 1) for i in range(8)])
+        self.assertFalse(av.apply_highlights(spans, point_regions))
+
+    def test_group_changed_mid_way_restarts(self):
+        av = make_view('x' * 100)
+        self.assertTrue(av.apply_highlights({'a': ((0, 1),) * 5}, point_regions))
+        new = {'a': ((2, 3),) * 4}
+        while av.apply_highlights(new, point_regions):
+            pass
+        self.assertEqual(av.view.get_regions('a'), [sublime.Region(2, 3)] * 4)
+
+    def test_removed_group_is_erased(self):
+        av = make_view('x' * 100)
+        av.apply_highlights({'a': ((0, 1),) * 5}, point_regions)
+        self.assertFalse(av.apply_highlights({}, point_regions))
+        self.assertEqual(av.view.get_regions('a'), [])
+        self.assertEqual(av.hl_partial, {})
+
+
+class BufferRegionsTest(unittest.TestCase):
+    # spans are (start row, start byte col, end row, end byte col) as ActualVimMatches exports them
+    def regions(self, text, *spans):
+        av = make_view(text)
+        return av.buffer_regions({'m': spans})['m']
+
+    def test_ascii(self):
+        self.assertEqual(self.regions('hello world', (0, 6, 0, 10)), [sublime.Region(6, 11)])
+
+    def test_search_after_multibyte(self):
+        # searchpos() gives the first byte of the last matched char
+        text = 'h\u00e9llo w\u00f6rld'
+        self.assertEqual(self.regions(text, (0, 7, 0, 8)), [sublime.Region(6, 8)])
+
+    def test_end_inside_multibyte(self):
+        # matchaddpos([[1, 2, 2]]) covers both bytes of the \u00e9, its end col is the second one
+        text = 'h\u00e9llo\nw\u00f6rld'
+        self.assertEqual(self.regions(text, (0, 1, 0, 2), (1, 1, 1, 2)),
+                         [sublime.Region(1, 2), sublime.Region(7, 8)])
+
+    def test_whole_line(self):
+        self.assertEqual(self.regions('ab\n\u00e9\u00e9\nc', (1, 0, 1, -1)), [sublime.Region(3, 5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import binascii
+import os
+import sys
+import unittest
+
+import support  # noqa
+
+if sys.platform.startswith('linux'):
+    from ActualVim.lib.neovim.msgpack_rpc.event_loop.pipe import PipeEventLoop
+
+# writes its argument (hex) to stdout and exits
+CHILD = '''
+import binascii, os, sys
+os.write(sys.stdout.fileno(), binascii.unhexlify(sys.argv[1]))
+'''
+
+
+def child(data=b''):
+    return PipeEventLoop('child', [sys.executable, '-c', CHILD, binascii.hexlify(data).decode()])
+
+
+def open_fds():
+    return set(os.listdir('/proc/self/fd'))
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'epoll pipe loop is linux only')
+class PipeEventLoopTest(unittest.TestCase):
+    def test_stop_while_draining_queued_data(self):
+        loop = child()
+        # data read before run() is queued and handed over first
+        loop._queued_data.extend([b'a', b'b'])
+        got = []
+
+        def on_data(data):
+            got.append(bytes(data))
+            loop.stop()
+
+        loop.run(on_data)
+        self.assertEqual(got, [b'a'])
+        loop._proc.kill()
+        loop._proc.wait()
+
+    def test_closes_fds_on_eof(self):
+        before = open_fds()
+        loop = child(b'hello')
+        got = []
+        loop.run(lambda data: got.append(bytes(data)))
+        loop._proc.wait()
+        self.assertEqual(b''.join(got), b'hello')
+        self.assertTrue(loop._closed)
+        self.assertEqual(open_fds(), before)
+        # wakeups after close are dropped instead of writing to a closed fd
+        loop.threadsafe_call(lambda: None)
+        self.assertRaises(IOError, loop.run, got.append)
+
+
+if __name__ == '__main__':
+    unittest.main()
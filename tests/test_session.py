@@ -0,0 +1,58 @@
+import queue
+import unittest
+from unittest import mock
+
+import support  # noqa
+from ActualVim.lib.neovim.msgpack_rpc.session import ErrorResponse, Session
+
+
+class FakeAsyncSession:
+    # queues threadsafe calls for the test to run later, like the I/O thread would
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def threadsafe_call(self, fn):
+        self.calls.put(fn)
+
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, value, error=False):
+        self.sent.append((value, error))
+
+
+class SessionTest(unittest.TestCase):
+    def request(self, handler):
+        # the handler runs on its own thread, the reply is sent from the (fake) I/O thread afterwards
+        loop = FakeAsyncSession()
+        session = Session(loop)
+        session._request_cb = handler
+        response = FakeResponse()
+        session._on_request('test', [], response)
+        drain = loop.calls.get(timeout=5)
+        with mock.patch('traceback.print_exc') as print_exc:
+            drain()
+        self.assertFalse(print_exc.called, 'sending the response raised')
+        self.assertEqual(len(response.sent), 1)
+        return response.sent[0]
+
+    def test_result(self):
+        self.assertEqual(self.request(lambda name, args: 42), (42, False))
+
+    def test_error_response(self):
+        def handler(name, args):
+            raise ErrorResponse('no such thing')
+        self.assertEqual(self.request(handler), ('no such thing', True))
+
+    def test_exception(self):
+        def handler(name, args):
+            raise ValueError('bad')
+        msg, error = self.request(handler)
+        self.assertTrue(error)
+        self.assertIn("ValueError('bad'", msg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# on-disk cache of nvim undo files and marks, so history survives restarts
+# entries live in <cache>/ActualVim/undo as <sha1 of path>.undo (written by :wundo) and .json,
+# and are only used when the view's text still hashes the same as when they were written
+
+import hashlib
+import json
+import os
+import sublime
+
+
+def root():
+    return os.path.join(sublime.cache_path(), 'ActualVim', 'undo')
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class Entry:
+    def __init__(self, path):
+        self.path = path
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(path)).encode('utf-8')).hexdigest()
+        base = os.path.join(root(), key)
+        self.undo = base + '.undo'
+        self.meta_path = base + '.json'
+        self.meta = {}
+
+    def load(self, text_hash):
+        # returns True if there's an entry for exactly this text
+        try:
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        except (IOError, ValueError):
+            return False
+        return self.meta.get('hash') == text_hash and os.path.exists(self.undo)
+
+    def save(self, text_hash, marks):
+        self.meta = {'path': self.path, 'hash': text_hash, 'marks': marks or {}}
+        with open(self.meta_path, 'w') as f:
+            json.dump(self.meta, f)
+
+    @property
+    def marks(self):
+        return self.meta.get('marks', {})
+
+
+def prepare():
+    os.makedirs(root(), exist_ok=True)
+
+
+def prune(limit):
+    # drop the least recently written entries past limit
+    try:
+        names = [n for n in os.listdir(root()) if n.endswith('.json')]
+    except OSError:
+        return
+    if len(names) <= limit:
+        return
+    paths = [os.path.join(root(), n) for n in names]
+    paths.sort(key=lambda p: os.path.getmtime(p))
+    for meta in paths[:len(paths) - limit]:
+        for p in (meta, meta[:-len('.json')] + '.undo'):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
@@ -1,12 +1,16 @@
+import bisect
 import queue
 import sublime
-import sublime_plugin
 import threading
 import traceback
+import unicodedata
 
 from . import neo
 from . import settings
+from . import undocache
+from .complete import Completer
 from .edit import Edit
+from .latency import tracer
 
 
 def copy_sel(sel):
@@ -14,6 +18,72 @@ def copy_sel(sel):
         sel = sel.sel()
     return [(r.a, r.b) for r in sel]
 
+def char_width(c, col, ts):
+    # display cells taken by c when it starts at display column col
+    if c == '\t':
+        return ts - col % ts
+    if c >= '\u1100' and unicodedata.east_asian_width(c) in ('W', 'F'):
+        return 2
+    return 1
+
+def display_starts(line, ts):
+    # display column each char of line starts at, plus the width of the line
+    starts = []
+    x = 0
+    for c in line:
+        starts.append(x)
+        x += char_width(c, x, ts)
+    starts.append(x)
+    return starts
+
+def block_regions(view, a, b, ts):
+    # regions for a vim visual block between a and b, (row, byte col) each
+    # vim blocks are by display column, so tabs and wide chars are measured rather than counted,
+    # and every row in the block comes from a single substr instead of per-line api calls
+    (sr, sc), (er, ec) = a, b
+    top, bot = min(sr, er), max(sr, er)
+    start = view.text_point(top, 0)
+    lines = view.substr(sublime.Region(start, view.line(view.text_point(bot, 0)).b)).split('\n')
+
+    def cells(line, col):
+        # display columns covered by the char at vim byte column col
+        i = len(line.encode('utf-8')[:col].decode('utf-8', 'ignore'))
+        x = 0
+        for c in line[:i]:
+            x += char_width(c, x, ts)
+        w = char_width(line[i], x, ts) if i < len(line) else 1
+        return x, x + w - 1
+
+    sa, ea = cells(lines[sr - top], sc)
+    sb, eb = cells(lines[er - top], ec)
+    left, right = min(sa, sb), max(ea, eb)
+    # the cursor end is on the left, so regions run right to left
+    backward = sb < sa
+
+    regions = []
+    pos = start
+    for line in lines:
+        x = 0
+        first = last = None
+        for i, c in enumerate(line):
+            w = char_width(c, x, ts)
+            if first is None and x + w > left:
+                first = i
+            if x > right:
+                last = i
+                break
+            x += w
+        if first is None and x >= left:
+            # short line ending at the block's left edge
+            first = len(line)
+        if first is not None:
+            if last is None:
+                last = len(line)
+            r = (pos + first, pos + last)
+            regions.append(r[::-1] if backward else r)
+        pos += len(line) + 1
+    return regions
+
 # called by neo.py once neovim is loaded
 def neovim_loaded():
     # ensure we have the newest neo module
@@ -24,6 +94,9 @@ def neovim_loaded():
         ActualVim.enable()
 
 def neovim_unloaded():
+    if neo._loaded and neo.vim.shared:
+        for av in _views.values():
+            av.save_state()
     if neo._loaded and settings.enabled():
         ActualVim.enable(False)
 
@@ -43,15 +116,33 @@ class ActualVim:
 
         self.view = view
         self.last_sel = None
+        # nvim instance holding our buffer, see the vim property
+        self._vim = None
         self.buf = None
         self.sub_changes = None
         self.vim_changes = None
         self.screen_changes = 0
         self.last_highlights = None
+        # region key per interned highlight id (see screen.intern), and the spans applied under each key
+        self.hl_keys = {}
+        self.hl_spans = {}
+        # key -> (spans, regions so far) for groups being converted over several frames
+        self.hl_partial = {}
+        # (changedtick, search pattern, matches) the buffer-space highlights were exported for
+        self.hl_export_key = None
+        # the spans exported under hl_export_key, and whether the budget left some of them unapplied
+        self.hl_export_spans = None
+        self.hl_export_pending = False
+        # screen row -> [buffer line, first display column] for the current window, and what it was built for
+        self.row_map = None
+        self.row_map_key = None
         self.last_status = None
         self.last_size = None
         self.block = False
         self.block_hit = False
+        # text changes not yet pushed to nvim because the view isn't active there, see defer_sync()
+        self.sync_pending = False
+        self.sync_gen = 0
 
         # first scroll is buggy
         self.first_scroll = True
@@ -64,10 +155,19 @@ class ActualVim:
 
         # tracks our drag_select type
         self.drag_select = None
+        # a mouse drag is in progress, selection changes are throttled (see drag_update)
+        self.dragging = False
+        self.drag_pending = False
+
+        # number of extra sublime selections mirrored into nvim as extmarks
+        self.extra_cursors = 0
 
         # tracks popup menu status
         self.popup = None
 
+        # word index and completion cache for ActualVimComplete
+        self.completer = Completer(view)
+
         en = settings.enabled()
         s = {
             'actual_intercept': en,
@@ -137,6 +237,12 @@ class ActualVim:
                 av.sel_from_vim()
             av.update_view()
 
+    @property
+    def vim(self):
+        if self._vim is None:
+            self._vim = neo.instance_for(self.view)
+        return self._vim
+
     @property
     def actual(self):
         return neo._loaded and self.view and self.settings.get('actual_mode') and self.settings.get('actual_intercept')
@@ -151,7 +257,8 @@ class ActualVim:
         view = self.view
         pos = view.text_point(row, 0)
         line = view.substr(sublime.Region(pos, pos + col))
-        vcol = len(line.encode('utf-8')[:col].decode('utf-8'))
+        # a col inside a multibyte char lands on the start of that char
+        vcol = len(line.encode('utf-8')[:col].decode('utf-8', 'ignore'))
         return view.text_point(row, vcol)
 
     def vim_rowcol(self, point):
@@ -192,21 +299,8 @@ class ActualVim:
             regions.append((a, b))
         elif name == 'visual block':
             # visual block mode
-            left = min(sc, ec)
-            right = max(sc, ec) + 1
-            top = min(sr, er)
-            bot = max(sr, er)
-            end = view.text_point(top, right)
-
-            for i in range(top, bot + 1):
-                line = view.line(view.text_point(i, 0))
-                _, end = view.rowcol(line.b)
-                if left <= end:
-                    a = view.text_point(i, left)
-                    b = view.text_point(i, min(right, end))
-                    if sc > ec:
-                        a, b = b, a
-                    regions.append((a, b))
+            ts = self.vim.status_last.get('ts') or self.settings.get('tab_size', 4)
+            regions += block_regions(view, (sr, sc), (er, ec), ts)
         else:
             regions.append((a, b))
 
@@ -242,7 +336,7 @@ class ActualVim:
         else:
             combined = top.get('vim', {})
             modes = combined.pop('modes')
-            mode = neo.vim.mode
+            mode = self.vim.mode
             name = neo.MODES.get(mode)
             combined.update(modes.get(name, {}))
             if mode in neo.VISUAL_MODES:
@@ -256,23 +350,50 @@ class ActualVim:
 
     def activate(self):
         if not neo._loaded: return
-        neo.vim.force_ready()
+        self.vim.force_ready()
         # first activate
         if self.buf is None:
-            self.buf = neo.vim.buf_new(self)
-            # disable undo on first insert
-            self.buf.options['undolevels'] = -1
-            self.sync_to_vim()
-            # re-enable undo
-            self.buf.options['undolevels'] = -123456
             path = self.view.file_name()
+            digest = path and self.digest()
+            in_sync = False
+            if path and self.vim.shared:
+                self.buf, in_sync = self.vim.buf_adopt(self, path, digest)
+            if self.buf is None:
+                self.buf = self.vim.buf_new(self)
+                undo = self.undo_entry(digest)
+                # disable undo on first insert
+                self.buf.options['undolevels'] = -1
+                # a saved file can be read by nvim from disk, at disk speed instead of rpc speed,
+                # as long as nvim ends up with the same text
+                if (path and not self.view.is_dirty() and settings.get('load_from_disk')
+                        and self.vim.buf_edit(self.buf, path) == digest):
+                    self.mark_changed()
+                    self.vim_changes = self.vim.buf_tick(self.buf)
+                else:
+                    self.sync_to_vim(force=True)
+                # re-enable undo
+                self.buf.options['undolevels'] = -123456
+                if undo:
+                    self.vim.buf_rundo(undo.undo, undo.marks)
+            elif in_sync:
+                self.mark_changed()
+                self.vim_changes = self.vim.buf_tick(self.buf)
+            else:
+                # keep the buffer's undo history, the difference becomes one more change
+                self.sync_to_vim(force=True)
             if path:
                 self.set_path(path)
 
-        if neo.vim.activate(self):
+        # changes made while another view was active in nvim
+        flushed = self.flush_sync()
+
+        if self.vim.activate(self):
             self.status_from_vim()
             self.update_view()
             self.highlight()
+        if flushed:
+            self.last_sel = None
+            self.sel_to_vim()
 
     def update_view(self):
         combined = self.avsettings.get('settings', {})
@@ -286,7 +407,7 @@ class ActualVim:
         vp = self.view.viewport_extent()
         width, height = vp[0] / self.view.em_width(), vp[1] / self.view.line_height()
         if self.actual:
-            neo.vim.resize(width, height)
+            self.vim.resize(width, height)
             # update_view is called all the time, and asking vim for things is expensive
             # so vim's tab priority comes automatically during sel_from_vim()
             if settings.get('indent_priority') == 'sublime':
@@ -298,14 +419,14 @@ class ActualVim:
         tmp['read_only'] = self.view.is_read_only()
         if tmp != self.last_settings:
             if tmp['translate_tabs_to_spaces']:
-                neo.vim.cmd('set expandtab ts={ts} shiftwidth={ts} softtabstop=0 smarttab'.format(ts=tmp['tab_size']))
+                self.vim.cmd('set expandtab ts={ts} shiftwidth={ts} softtabstop=0 smarttab'.format(ts=tmp['tab_size']))
             else:
-                neo.vim.cmd('set noexpandtab softtabstop=0')
+                self.vim.cmd('set noexpandtab softtabstop=0')
             if tmp['read_only']:
-                neo.vim.cmd('set noma')
+                self.vim.cmd('set noma')
             else:
-                neo.vim.cmd('set ma')
-        neo.vim.status(force=True)
+                self.vim.cmd('set ma')
+        self.vim.status(force=True)
 
     def settings_from_vim(self, et, ts):
         if et:
@@ -323,12 +444,48 @@ class ActualVim:
                 self.last_size = self.view.size()
             return
 
+        if not force and self.vim.av is not self:
+            # not the buffer nvim is showing (build output, a formatter rewriting a background file):
+            # don't touch nvim from the ui thread, push once on activate or when idle
+            self.defer_sync()
+            return
+
         self.mark_changed()
-        neo.vim.force_ready()
+        self.vim.force_ready()
         text = self.view.substr(sublime.Region(0, self.view.size())).split('\n')
         self.buf[:] = text
         self.sel_to_vim(force)
-        self.vim_changes = neo.vim.buf_tick(self.buf)
+        self.vim_changes = self.vim.buf_tick(self.buf)
+
+    def defer_sync(self):
+        # every change restarts the idle timer, so a burst of changes costs one push
+        self.sync_pending = True
+        self.sync_gen += 1
+        gen = self.sync_gen
+        sublime.set_timeout_async(lambda: self.flush_sync(gen), settings.get('background_sync_delay', 500))
+
+    def flush_sync(self, gen=None):
+        # push deferred changes with a single nvim_buf_set_lines, returns True if there were any
+        # gen is set by the idle timer: only the newest timer flushes, and it waits for nvim
+        # to be ready instead of interrupting a pending command with force_ready()
+        if not self.sync_pending or (gen is not None and gen != self.sync_gen):
+            return False
+        # the view was closed (or its buffer wiped) while the timer was armed
+        if self.buf is None or _views.get(self.view.id()) is not self:
+            return False
+        if gen is not None and not self.vim.check_ready():
+            sublime.set_timeout_async(lambda: self.flush_sync(gen), settings.get('background_sync_delay', 500))
+            return False
+        with self.busy:
+            if not self.sync_pending:
+                return False
+            self.sync_pending = False
+            self.mark_changed()
+            if gen is None:
+                self.vim.force_ready()
+            self.buf[:] = self.view.substr(sublime.Region(0, self.view.size())).split('\n')
+            self.vim_changes = self.vim.buf_tick(self.buf)
+        return True
 
     def sync_from_vim(self, edit=None):
         if not neo._loaded: return
@@ -339,17 +496,20 @@ class ActualVim:
                 # only sync text content if vim buffer changed
                 # TODO: change to buf.vars['changedtick'] when neovim master (0.2.0?) is stable
                 # TODO: batch this with sel/status?
-                tick = neo.vim.buf_tick(self.buf)
+                tick = self.vim.buf_tick(self.buf)
+                tracer.mark('tick')
                 if self.vim_changes is None or tick > self.vim_changes:
                     self.vim_changes = tick
                     # TODO: global UI change is GROSS, do deltas if possible
                     text = '\n'.join(self.buf[:])
+                    tracer.mark('fetch')
                     sel = view.sel()
                     r = sel[0]
                     for s in list(sel)[1:]:
                         r = r.cover(s)
                     view.replace(edit, sublime.Region(r.begin(), view.size()), text[r.begin():])
                     view.replace(edit, sublime.Region(0, r.begin()), text[:r.begin()])
+                    tracer.mark('replace')
 
                 self.mark_changed()
                 self.sel_from_vim(edit=edit)
@@ -358,18 +518,37 @@ class ActualVim:
         if edit:
             update(self.view, edit)
         else:
-            Edit.defer(self.view, update)
+            Edit.defer(self.view, update, key='sync')
+
+    def drag_update(self):
+        # mid-drag selection change: send only the latest selection, once per drag_interval
+        if self.drag_pending:
+            return
+        self.drag_pending = True
+
+        def flush():
+            self.drag_pending = False
+            if self.dragging:
+                # don't echo vim's selection back while sublime is still extending its own
+                self.sel_to_vim(readback=False)
+        sublime.set_timeout(flush, settings.get('drag_interval', 16))
+
+    def drag_end(self):
+        # the final selection is always sent and read back, even if a throttled send matched it
+        self.dragging = False
+        self.last_sel = None
+        self.sel_to_vim()
 
-    def sel_to_vim(self, force=False):
+    def sel_to_vim(self, force=False, readback=True):
         if not neo._loaded: return
         if not self.actual: return
         if self.sel_changed() and not self.changed:
-            neo.vim.force_ready()
+            self.vim.force_ready()
             # single selection for now...
             # TODO: block
             # TODO multiple select vim plugin integration
             sel = self.view.sel()[0]
-            vim = neo.vim
+            vim = self.vim
             b = self.vim_rowcol(sel.b)
             b = (b[0] + 1, b[1] + 1)
 
@@ -405,26 +584,50 @@ class ActualVim:
                         else:
                             b = (b[0] - 1, b[1])
                     vim.select(a, b, mode=mode)
+                self.cursors_to_vim()
 
-            self.sel_from_vim()
-            self.update_view()
+            if readback:
+                self.sel_from_vim()
+                self.update_view()
+
+    def cursors_to_vim(self):
+        # extra sublime cursors ride along as extmarks (one batched call), so nvim's edits move them
+        if self.vim.cursor_ns is None:
+            return
+        extra = list(self.view.sel())[1:]
+        if not extra and not self.extra_cursors:
+            return
+        points = []
+        for r in extra:
+            points += [self.vim_rowcol(r.a), self.vim_rowcol(r.b)]
+        self.vim.cursors_set(self.buf, points)
+        self.extra_cursors = len(extra)
+
+    def cursors_from_vim(self):
+        if not self.extra_cursors:
+            return []
+        points = [self.vim_text_point(row, col) for row, col in self.vim.cursors_get(self.buf)]
+        return [sublime.Region(a, b) for a, b in zip(points[::2], points[1::2])]
 
     def sel_from_vim(self, edit=None):
         if not neo._loaded: return
         if not self.actual: return
 
-        status = neo.vim.status()
+        status = self.vim.status()
         a = (status['vline'], status['vcol'])
         b = (status['cline'], status['ccol'])
 
         if settings.get('indent_priority') == 'vim':
             self.settings_from_vim(status['expandtab'], status['ts'])
         new_sel = self.visual(status['mode'], a, b)
+        if status['mode'] != '\x16':
+            new_sel += self.cursors_from_vim()
 
         def select(view, edit):
             sel = view.sel()
             sel.clear()
             sel.add_all(new_sel)
+            tracer.mark('select')
             self.sel_changed()
 
             # defer first scroll: vis detection seems buggy during load
@@ -451,10 +654,10 @@ class ActualVim:
         if edit:
             select(self.view, edit)
         else:
-            Edit.defer(self.view, select)
+            Edit.defer(self.view, select, key='select')
 
     def status_from_vim(self):
-        status = neo.vim.status_line
+        status = self.vim.status_line
         if status:
             self.view.set_status('actual', status)
         else:
@@ -469,7 +672,11 @@ class ActualVim:
         # process the key, then all buffered keys
         with self.busy:
             key = self.keyq.get()
-            _, ready = neo.vim.press(key)
+            if key == '<esc>' and self.extra_cursors and self.vim.status_last.get('mode') == 'n':
+                # like sublime, escape in normal mode drops back to a single cursor
+                self.vim.cursors_set(self.buf, [])
+                self.extra_cursors = 0
+            _, ready = self.vim.press(key)
             if ready:
                 # TODO: trigger UI update on vim event, not here?
                 # well, if we don't figure it out before returning control
@@ -480,15 +687,50 @@ class ActualVim:
             return ready
 
     def close(self):
-        if neo._loaded:
-            neo.vim.force_ready()
-            if self.buf is not None:
-                neo.vim.buf_close(self.buf)
+        # drop deferred changes and disarm the idle timer, the buffer is about to be wiped
+        self.sync_pending = False
+        self.sync_gen += 1
+        if neo._loaded and self.buf is not None:
+            self.vim.force_ready()
+            self.save_undo()
+            self.vim.buf_close(self.buf)
         ActualVim.remove(self.view)
 
     def set_path(self, path):
         self.buf.name = path
 
+    def digest(self):
+        return undocache.content_hash(self.view.substr(sublime.Region(0, self.view.size())))
+
+    def undo_entry(self, digest):
+        # cached undo history for exactly this text, if any
+        path = self.view.file_name()
+        if not path or not settings.get('undo_cache'):
+            return None
+        entry = undocache.Entry(path)
+        if entry.load(digest):
+            return entry
+
+    def save_undo(self):
+        path = self.view.file_name()
+        if not path or self.buf is None or not settings.get('undo_cache'):
+            return
+        try:
+            undocache.prepare()
+            entry = undocache.Entry(path)
+            marks = self.vim.buf_wundo(self.buf, entry.undo)
+            entry.save(self.digest(), marks)
+            undocache.prune(settings.get('undo_cache_entries', 500))
+        except Exception:
+            print('ActualVim: failed to save undo history for', path)
+            traceback.print_exc()
+
+    def save_state(self):
+        # remember which text this buffer matched, so the next session can adopt it from a shared server
+        if not neo._loaded or self.buf is None or not self.vim.shared:
+            return
+        self.buf.vars['actualvim_state'] = {'tick': self.vim.buf_tick(self.buf), 'hash': self.digest()}
+
     # neovim event callbacks
     def on_bell(self):
         bell = self.avsettings.get('bell', {})
@@ -507,6 +749,16 @@ class ActualVim:
         def html_escape(s):
             return s.replace('&', '&amp;').replace('<', '&lt;')
 
+        def render_item(i):
+            # TODO: use item['kind']?
+            item_template = '''
+            <div class="actualvim-popup-item{classes}">{text}</div>
+            '''
+            classes = ''
+            if i == self.popup['selected']:
+                classes = ' actualvim-popup-item-selected'
+            return item_template.format(classes=classes, text=self.popup['items'][i]['text'])
+
         def render(update=False):
             if self.popup:
                 template = '''
@@ -526,18 +778,11 @@ class ActualVim:
                     {items}
                     </div>
                 '''
-                # TODO: use item['kind']?
-                item_template = '''
-                <div class="actualvim-popup-item{classes}">{text}</div>
-                '''
-                items = []
-                for i, item in enumerate(self.popup['items']):
-                    item = item.copy()
-                    item['classes'] = ''
-                    if i == self.popup['selected']:
-                        item['classes'] = ' actualvim-popup-item-selected'
-                    items.append(item_template.format_map(item))
-                html = template.format(items='\n'.join(items))
+                # only draw a window of items around the selection
+                rendered = self.popup['rendered']
+                size = settings.get('popup_window', 50)
+                start = max(0, min(self.popup['selected'] - size // 2, len(rendered) - size))
+                html = template.format(items='\n'.join(rendered[start:start + size]))
                 if self.view.is_popup_visible() and update:
                     self.view.update_popup(html)
                 else:
@@ -547,12 +792,18 @@ class ActualVim:
             items, selected, row, col = args[0]
             items = [{'text': html_escape(item[0]), 'kind': html_escape(item[1])} for item in items]
             self.popup = {'items': items, 'selected': selected, 'pos': (row, col)}
+            self.popup['rendered'] = [render_item(i) for i in range(len(items))]
             render(update=False)
         elif cmd == 'popupmenu_hide':
             self.view.hide_popup()
         elif cmd == 'popupmenu_select':
             if self.popup:
-                self.popup['selected'] = args[0][0]
+                # re-render only the items whose selection state changed
+                last, self.popup['selected'] = self.popup['selected'], args[0][0]
+                rendered = self.popup['rendered']
+                for i in {last, self.popup['selected']}:
+                    if 0 <= i < len(rendered):
+                        rendered[i] = render_item(i)
             render(update=True)
 
     def on_write(self):
@@ -560,8 +811,10 @@ class ActualVim:
 
     def on_complete(self, findstart, base):
         def cur():
-            modified, et, ts, a, b = neo.vim.status()
-            sel = self.visual(neo.vim.mode, a, b)
+            status = self.vim.status()
+            a = (status['vline'], status['vcol'])
+            b = (status['cline'], status['ccol'])
+            sel = self.visual(status['mode'], a, b)
             return sel[0].b
 
         if int(findstart):
@@ -569,68 +822,182 @@ class ActualVim:
             r, c = self.vim_rowcol(word.a)
             return c
 
-        loc = cur()
-        completions, flags = sublime_plugin.on_query_completions(self.view.id(), base, [loc])
-        if not flags & sublime.INHIBIT_WORD_COMPLETIONS:
-            completions += self.view.extract_completions(base)
-
-        # TODO: .sublime-completion support?
-        if not flags & sublime.INHIBIT_EXPLICIT_COMPLETIONS:
-            pass
-
-        return completions
+        return self.completer.complete(base, cur(), settings.get('completion_timeout', 200) / 1000)
 
     def highlight(self, highlights=None):
         if not settings.get('highlights', False):
             return
+        if settings.get('highlight_source') == 'buffer':
+            return self.highlight_buffer()
 
-        highlights = highlights or self.last_highlights
-        if not highlights:
+        if highlights is None:
+            highlights = self.last_highlights
+        if highlights is None:
             return
 
         # TODO: autocmd VimResized?
         # TODO: split views?
         # TODO: allow configuring scope ("colormap")
-        status = neo.vim.status(False)
+        status = self.vim.status(False)
         if not status:
             return
 
+        whitelist = {'background', 'underline', 'reverse'}
+
         def filt(h):
-            whitelist = {'background', 'underline', 'reverse'}
-            return all((
-                set(h.highlight.keys()).intersection(whitelist),
-                h.line < status['wheight'],
-            ))
+            return h.line < status['wheight'] and not whitelist.isdisjoint(h.highlight)
         highlights = tuple(filter(filt, highlights))
-
-        wview = status['wview']
-        lineoff = wview['topline'] - wview['topfill'] - 1
-        coloff = wview['leftcol'] - wview['skipcol']
-        if highlights == self.last_highlights:
-            return
         self.last_highlights = highlights
+        rows, textoff = self.screen_rows(status)
 
-        regions = []
-        lines = {
-            (line + lineoff): self.buf[line + lineoff]
-            for line in {hl.line for hl in highlights}
-        }
+        # group spans by interned highlight id so each attribute set gets its own region set
+        # spans are (buffer line, start display column, end display column)
+        groups = {}
         for hl in highlights:
-            line = hl.line + lineoff
-            start = hl.start + coloff
-            end = hl.end + coloff
-            # fix tabs
-            if not status['expandtab']:
-                fix = lambda pos: pos - lines[line][:pos].count('\t') * (status['ts'] - 1)
-                start, end = fix(start), fix(end)
-            a = self.view.text_point(line, start)
-            b = self.view.text_point(line, end)
-            regions.append(sublime.Region(a, b))
-
-        if regions:
-            self.view.add_regions('actualvim_highlight', regions, 'error', '', sublime.DRAW_NO_OUTLINE)
+            if hl.line >= len(rows):
+                continue
+            line, vcol = rows[hl.line]
+            if line < 0:
+                continue
+            vcol -= textoff
+            groups.setdefault(hl.hl, []).append((line, max(0, hl.start + vcol), max(0, hl.end + vcol)))
+
+        spans = {}
+        for hl, group in groups.items():
+            name = self.hl_keys.get(hl)
+            if name is None:
+                name = self.hl_keys[hl] = 'actualvim_highlight_{}'.format(len(self.hl_keys))
+            spans[name] = tuple(group)
+
+        def regions(todo):
+            # fetch every line we need with a single nvim_buf_get_lines request
+            needed = {line for chunk in todo.values() for line, _, _ in chunk}
+            first = min(needed) if needed else 0
+            lines = self.buf[first:max(needed) + 1] if needed else []
+            starts = {}
+
+            def columns(line):
+                # display start of each char, measured once per line
+                cols = starts.get(line)
+                if cols is None:
+                    text = lines[line - first] if 0 <= line - first < len(lines) else ''
+                    cols = starts[line] = display_starts(text, status['ts'])
+                return cols
+
+            ret = {}
+            for name, chunk in todo.items():
+                ret[name] = []
+                for line, start, end in chunk:
+                    cols = columns(line)
+                    # start on the char covering start, end before the first char at or past end
+                    a = self.view.text_point(line, max(0, bisect.bisect_right(cols, start) - 1))
+                    b = self.view.text_point(line, min(bisect.bisect_left(cols, end), len(cols) - 1))
+                    ret[name].append(sublime.Region(a, b))
+            return ret
+
+        self.apply_highlights(spans, regions)
+
+    def screen_rows(self, status):
+        # returns the screen row map and the text offset (number/sign/fold columns) of the window
+        # it only changes when the window scrolls, resizes, opens or closes a fold, or the text changes,
+        # so one request is shared by every highlight until then
+        wview = status['wview']
+        key = (status['tick'], status['wwidth'], status['wheight'], status['botline'],
+               wview['topline'], wview['topfill'], wview['leftcol'], wview['skipcol'])
+        if key != self.row_map_key:
+            rowmap = self.vim.call('ActualVimRowMap')
+            self.row_map = ([tuple(row) for row in rowmap['rows']], rowmap['textoff'])
+            self.row_map_key = key
+        return self.row_map
+
+    def highlight_buffer(self):
+        # ask vim for match positions in buffer space instead of scraping the screen
+        # results only depend on the text and patterns, so scrolling reuses them as-is
+        if self.vim.av is not self:
+            return
+        status = self.vim.status(False)
+        if not status:
+            return
+        key = (status['tick'], status['hlsearch'], repr(status['matches']))
+        if key == self.hl_export_key:
+            # same matches: only finish what the budget left over last frame
+            if not self.hl_export_pending:
+                return
+            spans = self.hl_export_spans
         else:
-            self.view.erase_regions('actualvim_highlight')
+            res = self.vim.call('ActualVimMatches', settings.get('highlight_max_matches', 1000))
+            groups = {'search': res['search']}
+            groups.update(res['matches'])
+            spans = {
+                'actualvim_highlight_' + group: tuple(tuple(span) for span in group_spans)
+                for group, group_spans in groups.items()
+            }
+            self.hl_export_key = key
+            self.hl_export_spans = spans
+
+        self.hl_export_pending = self.apply_highlights(spans, self.buffer_regions)
+
+    def buffer_regions(self, todo):
+        # (start row, start byte col, end row, end byte col) spans to regions
+        # an end col of -1 runs to the end of the line
+        view = self.view
+        ret = {}
+        for name, chunk in todo.items():
+            ret[name] = []
+            for sr, sc, er, ec in chunk:
+                a = self.vim_text_point(sr, sc)
+                if ec < 0:
+                    b = view.line(view.text_point(er, 0)).b
+                else:
+                    # end is in the last matched char, which may be any of its bytes
+                    b = min(self.vim_text_point(er, ec) + 1, view.line(view.text_point(er, 0)).b)
+                ret[name].append(sublime.Region(a, b))
+        return ret
+
+    def apply_highlights(self, spans, regions):
+        # spans: {region key: tuple of spans}
+        # regions({key: spans}): convert a chunk of the spans under each key to sublime regions
+        # returns True if some spans were left for the next frame
+        for name in set(self.hl_spans) | set(self.hl_partial):
+            if name not in spans:
+                self.view.erase_regions(name)
+                self.hl_spans.pop(name, None)
+                self.hl_partial.pop(name, None)
+
+        changed = sorted(name for name, group in spans.items() if self.hl_spans.get(name) != group)
+        if not changed:
+            return False
+
+        # cap the spans converted per frame, a group larger than what's left of the budget
+        # is converted a chunk at a time and its regions grow over the next frames
+        budget = settings.get('highlight_budget', 2000)
+        todo = {}
+        for name in changed:
+            if budget <= 0:
+                break
+            group = spans[name]
+            partial = self.hl_partial.get(name)
+            if partial is None or partial[0] != group:
+                partial = self.hl_partial[name] = (group, [])
+            done = len(partial[1])
+            todo[name] = group[done:done + budget]
+            budget -= len(todo[name])
+
+        for name, new in regions(todo).items():
+            group, done = self.hl_partial[name]
+            done.extend(new)
+            if done:
+                self.view.add_regions(name, done, 'error', '', sublime.DRAW_NO_OUTLINE)
+            else:
+                self.view.erase_regions(name)
+            if len(done) == len(group):
+                self.hl_spans[name] = group
+                del self.hl_partial[name]
+
+        if any(name not in todo or name in self.hl_partial for name in changed):
+            sublime.set_timeout(self.highlight, 16)
+            return True
+        return False
 
     def on_redraw(self, data, screen):
         if screen.changes <= self.screen_changes: